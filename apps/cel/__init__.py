@@ -18,9 +18,19 @@ app.conf.beat_schedule = {
         "schedule": crontab(minute="*/10"),
         "args": (),
     },
+    "drain_billing_stream": {
+        "task": "apps.chat.tasks.drain_billing_stream",
+        "schedule": settings.BILLING_DRAIN_INTERVAL,
+        "args": (),
+    },
     "delete_old_history": {
         "task": "apps.chat.tasks.delete_old_history",
         "schedule": crontab(minute="0", hour="8"),
         "args": (),
     },
+    "delete_old_chat_log": {
+        "task": "apps.chat.tasks.delete_old_chat_log",
+        "schedule": crontab(minute="30", hour="8"),
+        "args": (),
+    },
 }
@@ -11,9 +11,12 @@ from apps.chat.models import (
     AIModel,
     ChatLog,
     ChatMessageChangeLog,
+    ChatMessageState,
+    ChatUsageRollup,
     ModelPermission,
     SystemPreset,
 )
+from apps.chat.registry import model_registry
 
 
 class UserNicknameMixin:
@@ -39,8 +42,9 @@ class ChatLogAdmin(UserNicknameMixin, admin.ModelAdmin):
         "created_at_formatted",
         "duration",
         "is_charged",
+        "is_cached",
     ]
-    list_filter = ["model"]
+    list_filter = ["model", "is_cached"]
     search_fields = ["user__nick_name", "user__username"]
 
     @admin.display(description=gettext_lazy("Total Price"))
@@ -69,7 +73,38 @@ class ChatLogAdmin(UserNicknameMixin, admin.ModelAdmin):
 
     @admin.display(description=gettext_lazy("Model Name"))
     def model_name(self, inst: ChatLog) -> str:
-        model_inst: AIModel = AIModel.objects.filter(model=inst.model).first()
+        model_inst: AIModel = model_registry.get(inst.model)
+        if model_inst is None:
+            return "--"
+        return model_inst.name
+
+
+@admin.register(ChatUsageRollup)
+class ChatUsageRollupAdmin(UserNicknameMixin, admin.ModelAdmin):
+    list_display = [
+        "id",
+        "day",
+        "user",
+        "user__nick_name",
+        "model",
+        "model_name",
+        "prompt_tokens",
+        "completion_tokens",
+        "vision_count",
+        "request_count",
+        "cost_formatted",
+    ]
+    list_filter = ["day", "model"]
+    search_fields = ["user__nick_name", "user__username"]
+    date_hierarchy = "day"
+
+    @admin.display(description=gettext_lazy("Cost"))
+    def cost_formatted(self, rollup: ChatUsageRollup) -> str:
+        return f"{rollup.cost:.4f}"
+
+    @admin.display(description=gettext_lazy("Model Name"))
+    def model_name(self, inst: ChatUsageRollup) -> str:
+        model_inst: AIModel = model_registry.get(inst.model)
         if model_inst is None:
             return "--"
         return model_inst.name
@@ -126,3 +161,11 @@ class ChatMessageChangeLogAdmin(admin.ModelAdmin):
     list_filter = ["action"]
     search_fields = ["user__nick_name", "user__username"]
     ordering = ["-id"]
+
+
+@admin.register(ChatMessageState)
+class ChatMessageStateAdmin(admin.ModelAdmin):
+    list_display = ["id", "user", "message_id", "action", "change_log_id", "updated_at"]
+    list_filter = ["action"]
+    search_fields = ["user__nick_name", "user__username"]
+    ordering = ["-updated_at"]
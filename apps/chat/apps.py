@@ -1,5 +1,6 @@
 from django.apps import AppConfig
-from django.db.models.signals import post_migrate
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save
 
 
 def reset_connection_cache(sender, **kwargs):
@@ -9,9 +10,29 @@ def reset_connection_cache(sender, **kwargs):
     ConnectionsHandler().init_key()
 
 
+def invalidate_model_registry(sender, **kwargs):
+    # pylint: disable=C0415
+    from apps.chat.registry import model_registry
+
+    transaction.on_commit(model_registry.invalidate)
+
+
+def invalidate_model_entitlements(sender, **kwargs):
+    # pylint: disable=C0415
+    from apps.chat.registry import model_entitlements
+
+    transaction.on_commit(model_entitlements.invalidate)
+
+
 class ChatConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.chat"
 
     def ready(self):
         post_migrate.connect(reset_connection_cache, sender=self)
+        post_save.connect(invalidate_model_registry, sender=self.get_model("AIModel"))
+        post_delete.connect(invalidate_model_registry, sender=self.get_model("AIModel"))
+        model_permission = self.get_model("ModelPermission")
+        post_save.connect(invalidate_model_entitlements, sender=model_permission)
+        post_delete.connect(invalidate_model_entitlements, sender=model_permission)
+        m2m_changed.connect(invalidate_model_entitlements, sender=model_permission.models.through)
@@ -0,0 +1,216 @@
+import datetime
+import json
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django_redis.client import DefaultClient
+from ovinc_client.core.logger import celery_logger, logger
+from redis import Redis, ResponseError
+
+from apps.chat.constants import (
+    BILLING_STREAM_GROUP,
+    BILLING_STREAM_KEY,
+    CHAT_LOG_BUFFER_KEY,
+)
+from apps.chat.models import ChatLog, ChatUsageRollup
+from apps.wallet.models import Wallet
+from apps.wallet.utils import wallet_hold
+
+cache: DefaultClient
+
+
+def calculate_cost(log: ChatLog) -> Decimal:
+    return (
+        (log.prompt_tokens * log.prompt_token_unit_price / 1000)
+        + (log.completion_tokens * log.completion_token_unit_price / 1000)
+        + (log.vision_count * log.vision_unit_price / 1000)
+        + (log.request_unit_price / 1000)
+    )
+
+
+def get_log_day(log: ChatLog) -> datetime.date:
+    return datetime.datetime.fromtimestamp(log.created_at / 1000, tz=timezone.get_current_timezone()).date()
+
+
+def update_usage_rollup(logs: list[ChatLog]) -> None:
+    """
+    add charged logs into daily rollup, one update for each (user, model, day)
+    """
+
+    usages = defaultdict(lambda: defaultdict(Decimal))
+    for log in logs:
+        usage = usages[(log.user_id, log.model or "", get_log_day(log))]
+        usage["prompt_tokens"] += log.prompt_tokens
+        usage["completion_tokens"] += log.completion_tokens
+        usage["vision_count"] += log.vision_count
+        usage["request_count"] += 1
+        usage["cost"] += calculate_cost(log)
+    if not usages:
+        return
+    ChatUsageRollup.objects.bulk_create(
+        [ChatUsageRollup(user_id=user_id, model=model, day=day) for user_id, model, day in usages],
+        ignore_conflicts=True,
+    )
+    for (user_id, model, day), usage in sorted(usages.items()):
+        ChatUsageRollup.objects.filter(user_id=user_id, model=model, day=day).update(
+            **{key: F(key) + value for key, value in usage.items()}
+        )
+
+
+def dump_log(log: ChatLog) -> str:
+    return json.dumps(
+        {field.attname: getattr(log, field.attname) for field in ChatLog._meta.concrete_fields}, cls=DjangoJSONEncoder
+    )
+
+
+def load_log(data: str | bytes) -> ChatLog:
+    data = json.loads(data)
+    return ChatLog(**{field.attname: field.to_python(data[field.attname]) for field in ChatLog._meta.concrete_fields})
+
+
+@transaction.atomic()
+def charge_logs(log_ids: list[str], buffered_logs: list[ChatLog] | None = None) -> set[str]:
+    """
+    charge finished logs with one wallet update per user, logs already charged are skipped
+    buffered logs not saved yet are inserted as charged, so each log is written once
+    return ids of logs found
+    """
+
+    logs = list(ChatLog.objects.select_for_update().filter(id__in=log_ids, finished_at__isnull=False))
+    saved_ids = {log.id for log in logs}
+    new_logs = [log for log in buffered_logs or [] if log.id not in saved_ids]
+    amounts = defaultdict(Decimal)
+    charged_logs = []
+    for log in logs + new_logs:
+        if log.is_charged:
+            continue
+        celery_logger.info(
+            "[CalculateUsageLimit] LogID: %s; User: %s; Model: %s; Usage: %d; Vision: %d",
+            log.id,
+            log.user_id,
+            log.model,
+            log.prompt_tokens + log.completion_tokens,
+            log.vision_count,
+        )
+        amounts[log.user_id] += calculate_cost(log)
+        charged_logs.append(log)
+    update_ids = [log.id for log in charged_logs if log.id in saved_ids]
+    if update_ids:
+        ChatLog.objects.filter(id__in=update_ids).update(is_charged=True)
+    # conflicts raise and roll back the whole batch, so a log inserted by another consumer is never charged twice
+    for log in new_logs:
+        log.is_charged = True
+    ChatLog.objects.bulk_create(new_logs, batch_size=settings.BILLING_BATCH_SIZE)
+    update_usage_rollup(charged_logs)
+    # update wallets in fixed order to avoid deadlock
+    for user_id in sorted(amounts.keys()):
+        Wallet.objects.filter(user_id=user_id).update(balance=F("balance") - amounts[user_id])
+    # settle holds after balance committed
+    transaction.on_commit(lambda: [wallet_hold.release(user_id=log.user_id, hold_id=log.id) for log in charged_logs])
+    return saved_ids | {log.id for log in new_logs}
+
+
+class BillingQueue:
+    """
+    Durable billing queue on redis stream, drained in batches by celery
+    """
+
+    def __init__(self) -> None:
+        self.redis: Redis = cache.client.get_client()
+
+    def push(self, log: ChatLog) -> bool:
+        """
+        buffer finished log and queue it for billing atomically
+        """
+
+        try:
+            pipeline = self.redis.pipeline(transaction=True)
+            pipeline.hset(CHAT_LOG_BUFFER_KEY, log.id, dump_log(log))
+            pipeline.xadd(BILLING_STREAM_KEY, {"log_id": log.id})
+            pipeline.execute()
+            return True
+        except Exception as err:  # pylint: disable=W0718
+            logger.warning("[PushBillingFailed] %s %s", log.id, err)
+            return False
+
+    def load_buffered_logs(self, log_ids: list[str]) -> list[ChatLog]:
+        return [load_log(data) for data in self.redis.hmget(CHAT_LOG_BUFFER_KEY, log_ids) if data]
+
+    def ensure_group(self) -> None:
+        try:
+            self.redis.xgroup_create(BILLING_STREAM_KEY, BILLING_STREAM_GROUP, id="0", mkstream=True)
+        except ResponseError as err:
+            if "BUSYGROUP" not in str(err):
+                raise err
+
+    def read(self, consumer: str, count: int) -> list[tuple[str, str]]:
+        """
+        read entries as (entry_id, log_id), entries left pending by crashed consumers are reclaimed first
+        """
+
+        _, entries, *_ = self.redis.xautoclaim(
+            BILLING_STREAM_KEY,
+            BILLING_STREAM_GROUP,
+            consumer,
+            min_idle_time=settings.BILLING_CLAIM_IDLE_TIME * 1000,
+            start_id="0-0",
+            count=count,
+        )
+        if len(entries) < count:
+            for _, items in self.redis.xreadgroup(
+                BILLING_STREAM_GROUP, consumer, {BILLING_STREAM_KEY: ">"}, count=count - len(entries)
+            ):
+                entries.extend(items)
+        return [(entry_id.decode(), fields[b"log_id"].decode()) for entry_id, fields in entries if fields]
+
+    def ack(self, entry_ids: list[str], log_ids: list[str]) -> None:
+        if not entry_ids:
+            return
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.xack(BILLING_STREAM_KEY, BILLING_STREAM_GROUP, *entry_ids)
+        pipeline.xdel(BILLING_STREAM_KEY, *entry_ids)
+        pipeline.hdel(CHAT_LOG_BUFFER_KEY, *log_ids)
+        pipeline.execute()
+
+    def drain(self, consumer: str) -> int:
+        """
+        drain stream in batches, return count of entries processed
+        """
+
+        self.ensure_group()
+        total = 0
+        for _ in range(settings.BILLING_MAX_BATCHES):
+            entries = self.read(consumer=consumer, count=settings.BILLING_BATCH_SIZE)
+            if not entries:
+                break
+            log_ids = list({log_id for _, log_id in entries})
+            try:
+                found = charge_logs(log_ids=log_ids, buffered_logs=self.load_buffered_logs(log_ids))
+            except IntegrityError as err:
+                # logs saved by another consumer meanwhile, charged ones are skipped on retry
+                celery_logger.warning("[ChargeLogsConflict] %s", err)
+                break
+            # logs not saved yet are retried after claim idle time, until considered orphan
+            orphan_before = (time.time() - settings.BILLING_ORPHAN_TIMEOUT) * 1000
+            processed = []
+            for entry_id, log_id in entries:
+                if log_id in found:
+                    processed.append((entry_id, log_id))
+                elif int(entry_id.split("-")[0]) < orphan_before:
+                    celery_logger.error("[BillingLogNotFound] EntryID: %s; LogID: %s", entry_id, log_id)
+                    processed.append((entry_id, log_id))
+            self.ack(entry_ids=[entry_id for entry_id, _ in processed], log_ids=[log_id for _, log_id in processed])
+            total += len(processed)
+            if len(entries) < settings.BILLING_BATCH_SIZE:
+                break
+        return total
+
+
+billing_queue = BillingQueue()
@@ -1,27 +1,48 @@
 import abc
+import asyncio
 import base64
 import datetime
 import math
-
+import random
+import time
+from contextlib import aclosing
+from decimal import Decimal
+from email.utils import parsedate_to_datetime
+
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from django.utils.translation import gettext
-from httpx import Client
-from openai import OpenAI
+from httpx import Headers
+from openai import APIConnectionError, APIStatusError
 from openai.types import CompletionUsage
+from openai.types.chat import ChatCompletionChunk
 from opentelemetry import trace
 from opentelemetry.sdk.trace import Span
 from opentelemetry.trace import SpanKind
 from ovinc_client.core.logger import logger
-
+from ovinc_client.core.utils import uniq_id_without_time
+
+from apps.chat.billing import billing_queue
+from apps.chat.client.image import image_cache, image_loader, image_processor
+from apps.chat.client.limiter import concurrency_limiter
+from apps.chat.client.pool import UpstreamResponse, openai_client_pool
+from apps.chat.client.response_cache import response_cache
+from apps.chat.client.router import endpoint_router
+from apps.chat.client.sse import RawChunkStream
 from apps.chat.constants import MessageContentType, OpenAIRole, SpanType, ThinkStatus
-from apps.chat.exceptions import FileExtractFailed
-from apps.chat.models import AIModel, ChatLog, Message, MessageContent
+from apps.chat.exceptions import ModelBusy
+from apps.chat.models import AIModel, ChatLog, Message, MessageContent, UpstreamEndpoint
+from apps.chat.registry import model_registry
 from apps.chat.tasks import calculate_usage_limit
-from apps.chat.utils import format_error, format_response
+from apps.chat.tokenizer import get_tokenizer
+from apps.chat.utils import format_error, format_queue, format_response
 from apps.cos.client import COSClient
+from apps.wallet.exceptions import NoBalanceException
+from apps.wallet.models import Wallet
+from apps.wallet.utils import wallet_hold
 from utils.prometheus.constants import PrometheusLabels, PrometheusMetrics
 from utils.prometheus.exporters import PrometheusExporter
 
@@ -38,21 +59,27 @@ class BaseClient:
     def __init__(self, user: str, model: str, messages: list[Message]):
         self.user: USER_MODEL = get_object_or_404(USER_MODEL, username=user)
         self.model: str = model
-        self.model_inst: AIModel = AIModel.objects.get(model=model, is_enabled=True)
+        self.model_inst: AIModel = model_registry.get_model(model)
         self.model_settings: dict = self.model_inst.settings or {}
         self.messages = [
             message
             for message in messages
             if (message.role != OpenAIRole.SYSTEM or self.model_inst.support_system_define)
         ]
-        self.log = ChatLog.objects.create(
+        self.tokenizer = get_tokenizer(self.tokenizer_name)
+        self.messages = self.fit_context(self.messages)
+        # kept in memory during chat and saved once by billing, the reserved id is used as log_id and data_id
+        log_id = uniq_id_without_time()
+        self.hold_balance(hold_id=log_id)
+        self.log = ChatLog(
+            id=log_id,
             user=self.user,
             model=self.model,
             created_at=int(datetime.datetime.now().timestamp() * 1000),
         )
         self.tracer = trace.get_tracer(self.__class__.__name__)
 
-    def chat(self, *args, **kwargs) -> any:
+    async def chat(self, *args, **kwargs) -> any:
         """
         Chat
         """
@@ -73,29 +100,47 @@ class BaseClient:
                     audit_content = str(content)
                 # call audit api
                 client = COSClient()
-                client.text_audit(user=self.user, content=audit_content, data_id=self.log.id)
+                await sync_to_async(client.text_audit, thread_sensitive=False)(
+                    user=self.user, content=audit_content, data_id=self.log.id
+                )
                 for image in audit_image:
-                    client.image_audit(user=self.user, image_url=image, data_id=self.log.id)
+                    await sync_to_async(client.image_audit, thread_sensitive=False)(
+                        user=self.user, image_url=image, data_id=self.log.id
+                    )
             except Exception as err:
-                self.record()
+                await database_sync_to_async(self.record)()
                 raise err
 
         with self.start_span(SpanType.CHAT, SpanKind.SERVER):
             try:
-                yield from self._chat(*args, **kwargs)
+                async with aclosing(self._chat(*args, **kwargs)) as stream:
+                    async for data in stream:
+                        yield data
+            except (asyncio.CancelledError, GeneratorExit):
+                # aborted before upstream stream started, nothing received
+                if self.log.finished_at is None:
+                    await database_sync_to_async(self.record)()
+                raise
             except Exception as err:
-                self.record()
+                await database_sync_to_async(self.record)()
                 raise err
 
     @abc.abstractmethod
-    def _chat(self, *args, **kwargs) -> any:
+    async def _chat(self, *args, **kwargs) -> any:
         """
         Chat
         """
 
         raise NotImplementedError()
 
-    def record(self, prompt_tokens: int = 0, completion_tokens: int = 0, vision_count: int = 0) -> None:
+    # pylint: disable=R0913,R0917
+    def record(
+        self,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        vision_count: int = 0,
+        price_rate: Decimal = Decimal(1),
+    ) -> None:
         if not self.log:
             return
         # calculate tokens
@@ -103,15 +148,113 @@ class BaseClient:
         self.log.completion_tokens = max(completion_tokens, self.log.completion_tokens)
         self.log.vision_count = max(vision_count, self.log.vision_count)
         # calculate price
-        self.log.prompt_token_unit_price = self.model_inst.prompt_price
-        self.log.completion_token_unit_price = self.model_inst.completion_price
-        self.log.vision_unit_price = self.model_inst.vision_price
-        self.log.request_unit_price = self.model_inst.request_price
-        # save
+        self.log.prompt_token_unit_price = self.model_inst.prompt_price * price_rate
+        self.log.completion_token_unit_price = self.model_inst.completion_price * price_rate
+        self.log.vision_unit_price = self.model_inst.vision_price * price_rate
+        self.log.request_unit_price = self.model_inst.request_price * price_rate
+        # buffer and charge in batches by billing worker, save and charge inline as fallback
         self.log.finished_at = int(timezone.now().timestamp() * 1000)
-        self.log.save()
-        # calculate usage
-        calculate_usage_limit(log_id=self.log.id)  # pylint: disable=E1120
+        if not billing_queue.push(log=self.log):
+            self.log.save()
+            calculate_usage_limit(log_id=self.log.id)  # pylint: disable=E1120
+
+    @property
+    def tokenizer_name(self) -> str:
+        return settings.CONTEXT_TOKENIZER
+
+    @property
+    def max_context_tokens(self) -> int:
+        return settings.CONTEXT_MAX_TOKENS
+
+    @property
+    def reserved_completion_tokens(self) -> int:
+        return settings.CONTEXT_RESERVED_COMPLETION_TOKENS
+
+    def fit_context(self, messages: list[Message]) -> list[Message]:
+        """
+        trim oldest turns to fit context budget, system messages and the latest turn are always kept
+        """
+
+        if self.max_context_tokens <= 0 or len(messages) <= 1:
+            return messages
+        budget = self.max_context_tokens - self.reserved_completion_tokens
+        latest = messages[-1]
+        used = self.tokenizer.count_message(latest) + sum(
+            self.tokenizer.count_message(message) for message in messages[:-1] if message.role == OpenAIRole.SYSTEM
+        )
+        # keep history from newest to oldest until budget exhausted
+        history = [message for message in messages[:-1] if message.role != OpenAIRole.SYSTEM]
+        keep_count = 0
+        for message in reversed(history):
+            tokens = self.tokenizer.count_message(message)
+            if used + tokens > budget:
+                break
+            used += tokens
+            keep_count += 1
+        kept = history[len(history) - keep_count :]
+        # do not start history with a dangling assistant reply
+        while kept and kept[0].role != OpenAIRole.USER:
+            kept = kept[1:]
+        if len(kept) == len(history):
+            return messages
+        logger.info(
+            "[ContextTrimmed] %s %s; Dropped: %d; Tokens: %d",
+            self.model,
+            self.user.username,
+            len(history) - len(kept),
+            used,
+        )
+        kept_ids = {id(message) for message in kept}
+        return [
+            message for message in messages[:-1] if message.role == OpenAIRole.SYSTEM or id(message) in kept_ids
+        ] + [latest]
+
+    def estimate_cost(self) -> Decimal:
+        """
+        worst-case cost, with full completion budget used
+        """
+
+        image_count = sum(
+            1
+            for message in self.messages
+            if isinstance(message.content, list)
+            for content in message.content
+            if content.type == MessageContentType.IMAGE_URL
+        )
+        return (
+            self.tokenizer.count_messages(self.messages) * self.model_inst.prompt_price
+            + self.reserved_completion_tokens * self.model_inst.completion_price
+            + image_count * self.model_inst.vision_price
+            + self.model_inst.request_price
+        ) / 1000
+
+    def hold_balance(self, hold_id: str) -> None:
+        """
+        hold estimated cost before dispatching to upstream, settled in calculate_usage_limit
+        """
+
+        amount = self.estimate_cost()
+        if amount <= 0:
+            return
+        wallet = Wallet.objects.filter(user=self.user).first()
+        balance = wallet.balance if wallet else Decimal(0)
+        if not wallet_hold.hold(user_id=self.user.pk, hold_id=hold_id, amount=amount, balance=balance):
+            logger.warning(
+                "[HoldBalanceFailed] %s %s; Amount: %s; Balance: %s", self.user.username, self.model, amount, balance
+            )
+            raise NoBalanceException()
+
+    def release_balance(self) -> None:
+        """
+        release hold of chat never recorded, recorded logs are settled by billing
+        """
+
+        if self.log.finished_at is not None:
+            return
+        wallet_hold.release(user_id=self.user.pk, hold_id=self.log.id)
+
+    def estimate_prompt_tokens(self) -> int:
+        return self.tokenizer.count_messages(self.messages)
 
     def start_span(self, name: str, kind: SpanKind, **kwargs) -> Span:
         span: Span = self.tracer.start_as_current_span(name=name, kind=kind, **kwargs)
@@ -134,9 +277,13 @@ class OpenAIBaseClient(BaseClient, abc.ABC):
         raise NotImplementedError()
 
     @property
-    def http_client(self) -> Client | None:
+    def proxy(self) -> str | None:
         return None
 
+    @property
+    def endpoints(self) -> list[UpstreamEndpoint]:
+        return [UpstreamEndpoint(base_url=self.base_url, api_key=self.api_key, proxy=self.proxy)]
+
     @property
     def timeout(self) -> int:
         return settings.OPENAI_CHAT_TIMEOUT
@@ -169,76 +316,508 @@ class OpenAIBaseClient(BaseClient, abc.ABC):
     def thinking_key(self) -> str:
         return ""
 
-    def _chat(self, *args, **kwargs) -> any:
-        image_count = self.format_message()
-        client = OpenAI(api_key=self.api_key, base_url=self.base_url, http_client=self.http_client)
-        req_time = PrometheusExporter.current_ts()
+    @property
+    def raw_stream(self) -> bool:
+        return False
+
+    @property
+    def retry_status_codes(self) -> list[int]:
+        return settings.UPSTREAM_RETRY_STATUS_CODES
+
+    @property
+    def retry_max_attempts(self) -> int:
+        return settings.UPSTREAM_RETRY_MAX_ATTEMPTS
+
+    @property
+    def retry_backoff(self) -> int:
+        return settings.UPSTREAM_RETRY_BACKOFF
+
+    @property
+    def retry_max_backoff(self) -> int:
+        return settings.UPSTREAM_RETRY_MAX_BACKOFF
+
+    @property
+    def retry_deadline(self) -> int:
+        return settings.UPSTREAM_RETRY_DEADLINE
+
+    @property
+    def hedge_enabled(self) -> bool:
+        return False
+
+    @property
+    def hedge_delay(self) -> int | None:
+        return None
+
+    @property
+    def vision_max_edge(self) -> int:
+        return settings.VISION_IMAGE_MAX_EDGE
+
+    @property
+    def vision_quality(self) -> int:
+        return settings.VISION_IMAGE_QUALITY
+
+    @property
+    def vision_format(self) -> str:
+        return settings.VISION_IMAGE_FORMAT
+
+    @property
+    def concurrency(self) -> int:
+        return 0
+
+    @property
+    def queue_size(self) -> int:
+        return settings.UPSTREAM_LIMITER_QUEUE_SIZE
+
+    @property
+    def response_cache_enabled(self) -> bool:
+        return False
+
+    @property
+    def response_cache_timeout(self) -> int:
+        return settings.RESPONSE_CACHE_TIMEOUT
+
+    @property
+    def response_cache_price_rate(self) -> Decimal:
+        return Decimal(str(settings.RESPONSE_CACHE_PRICE_RATE))
+
+    async def _chat(self, *args, **kwargs) -> any:
+        # replay cached response
+        cache_key = self.build_response_cache_key()
+        if cache_key:
+            cached = await response_cache.get(cache_key)
+            if cached:
+                async with aclosing(self.replay_response(cached)) as stream:
+                    async for data in stream:
+                        yield data
+                return
+        image_count = await self.format_message()
+        response = []
         try:
-            with self.start_span(SpanType.API, SpanKind.CLIENT):
-                response = client.chat.completions.create(
-                    model=self.api_model,
-                    messages=[message.model_dump(exclude_none=True) for message in self.messages],
-                    stream=self.use_stream,
-                    timeout=self.timeout,
-                    stream_options={"include_usage": True} if self.use_stream else None,
-                    extra_headers={
-                        "HTTP-Referer": settings.PROJECT_URL,
-                        "X-Title": settings.PROJECT_NAME,
-                        **self.extra_headers,
+            try:
+                async with aclosing(self.wait_slot()) as waiting:
+                    async for data in waiting:
+                        yield data
+                req_time = PrometheusExporter.current_ts()
+                response = await self.open_response()
+            except Exception as err:  # pylint: disable=W0718
+                logger.error("[GenerateContentFailed] %s", err)
+                yield format_error(self.log.id, err)
+                req_time = PrometheusExporter.current_ts()
+            contents = []
+            async with aclosing(
+                self.parse_response(response=response, image_count=image_count, req_time=req_time)
+            ) as stream:
+                async for data in stream:
+                    contents.append(data)
+                    yield data
+            if cache_key and isinstance(response, UpstreamResponse) and self.log.completion_tokens:
+                await response_cache.set(
+                    cache_key,
+                    {
+                        "data": "".join(content["data"] for content in contents),
+                        "thinking": "".join(content["thinking"] for content in contents),
+                        "prompt_tokens": self.log.prompt_tokens,
+                        "completion_tokens": self.log.completion_tokens,
                     },
-                    extra_query=self.extra_query,
-                    extra_body=self.extra_body,
-                    **self.extra_chat_params,
+                    timeout=self.response_cache_timeout,
                 )
-        except Exception as err:  # pylint: disable=W0718
-            logger.error("[GenerateContentFailed] %s", err)
-            yield format_error(self.log.id, err)
-            response = []
-        if not self.use_stream:
-            response = [response]
-        yield from self.parse_response(response=response, image_count=image_count, req_time=req_time)
-
-    def parse_response(self, response, image_count, req_time) -> None:
+        finally:
+            await self.close_response(response)
+            await self.release_slot()
+
+    def build_response_cache_key(self) -> str | None:
+        """
+        only text requests are cacheable, image urls are signed and change every time
+        endpoint is selected after cache lookup, so endpoints serving different models are not cacheable
+        """
+
+        if not self.response_cache_enabled:
+            return None
+        api_models = {endpoint.api_model or self.api_model for endpoint in self.endpoints}
+        if len(api_models) != 1:
+            return None
+        for message in self.messages:
+            if isinstance(message.content, list) and any(
+                content.type != MessageContentType.TEXT for content in message.content
+            ):
+                return None
+        return response_cache.build_key(
+            {
+                "model": self.model,
+                "api_model": api_models.pop(),
+                "messages": [message.model_dump(exclude_none=True) for message in self.messages],
+                "thinking_key": self.thinking_key,
+                "extra_headers": self.extra_headers,
+                "extra_query": self.extra_query,
+                "extra_body": self.extra_body,
+                "extra_chat_params": self.extra_chat_params,
+            }
+        )
+
+    async def replay_response(self, cached: dict) -> any:
+        """
+        replay cached response through the same stream path at configured pace
+        """
+
+        self.log.is_cached = True
+        size = settings.RESPONSE_CACHE_REPLAY_CHUNK_SIZE
+        replayed = []
+        try:
+            for key in ["thinking", "data"]:
+                content = cached[key]
+                for index in range(0, len(content), size):
+                    replayed.append(content[index : index + size])
+                    yield format_response(log_id=self.log.id, **{key: replayed[-1]})
+                    if settings.RESPONSE_CACHE_REPLAY_DELAY:
+                        await asyncio.sleep(settings.RESPONSE_CACHE_REPLAY_DELAY / 1000)
+        except (asyncio.CancelledError, GeneratorExit):
+            # client has gone, bill what has been replayed at cache price
+            await database_sync_to_async(self.record)(
+                prompt_tokens=cached["prompt_tokens"],
+                completion_tokens=self.tokenizer.count("".join(replayed)),
+                price_rate=self.response_cache_price_rate,
+            )
+            raise
+        await database_sync_to_async(self.record)(
+            prompt_tokens=cached["prompt_tokens"],
+            completion_tokens=cached["completion_tokens"],
+            price_rate=self.response_cache_price_rate,
+        )
+        await self.report_metric(name=PrometheusMetrics.RESPONSE_CACHE_HIT, value=1)
+
+    async def wait_slot(self) -> any:
+        """
+        wait in the fair queue for an upstream slot when model concurrency is limited, yield queue position on change
+        """
+
+        if self.concurrency <= 0:
+            return
+        token = self.log.id
+        wait_start = PrometheusExporter.current_ts()
+        last_position = None
+        while True:
+            position = await concurrency_limiter.acquire(model=self.model, token=token, capacity=self.concurrency)
+            # join queue at first, or rejoin after dropped
+            if position < 0:
+                depth = await concurrency_limiter.enqueue(
+                    model=self.model, user=self.user.username, token=token, queue_size=self.queue_size
+                )
+                if depth < 0:
+                    logger.warning("[UpstreamQueueFull] %s %s", self.model, self.user.username)
+                    raise ModelBusy()
+                await self.report_metric(name=PrometheusMetrics.UPSTREAM_QUEUE_DEPTH, value=depth)
+                continue
+            if position == 0:
+                break
+            if PrometheusExporter.current_ts() - wait_start > settings.UPSTREAM_LIMITER_QUEUE_TIMEOUT * 1000:
+                logger.warning("[UpstreamQueueTimeout] %s %s", self.model, self.user.username)
+                raise ModelBusy()
+            if position != last_position:
+                last_position = position
+                yield format_queue(log_id=self.log.id, position=position)
+            await asyncio.sleep(settings.UPSTREAM_LIMITER_POLL_INTERVAL)
+        await self.report_metric(
+            name=PrometheusMetrics.UPSTREAM_QUEUE_WAIT, value=PrometheusExporter.current_ts() - wait_start
+        )
+
+    async def renew_slot(self) -> None:
+        if self.concurrency <= 0:
+            return
+        if not await concurrency_limiter.renew(model=self.model, token=self.log.id):
+            logger.warning("[UpstreamSlotLost] %s %s", self.model, self.log.id)
+
+    async def release_slot(self) -> None:
+        if self.concurrency <= 0:
+            return
+        # also leaves the queue when released before slot acquired
+        await concurrency_limiter.release(model=self.model, token=self.log.id)
+
+    async def open_response(self) -> UpstreamResponse:
+        """
+        retry transient upstream errors with backoff, nothing has been yielded to user before first token
+        """
+
+        hedge_delay = await self.load_hedge_delay()
+        deadline = time.monotonic() + self.retry_deadline
+        attempt = 0
+        with self.start_span(SpanType.API, SpanKind.CLIENT):
+            while True:
+                attempt += 1
+                try:
+                    with self.start_span(SpanType.ATTEMPT, SpanKind.CLIENT, attributes={"attempt": attempt}):
+                        return await self.request_endpoints(hedge_delay=hedge_delay)
+                except Exception as err:  # pylint: disable=W0718
+                    delay = self.get_retry_delay(err=err, attempt=attempt)
+                    if delay is None or time.monotonic() + delay > deadline:
+                        raise err
+                    logger.warning("[UpstreamRetry] %s %d %s %s", self.model, attempt, delay, err)
+                    await self.report_metric(name=PrometheusMetrics.UPSTREAM_RETRY, value=1)
+                    await asyncio.sleep(delay)
+
+    def get_retry_delay(self, err: Exception, attempt: int) -> float | None:
+        """
+        seconds to wait before next attempt, none for not retryable
+        """
+
+        if attempt >= self.retry_max_attempts:
+            return None
+        if isinstance(err, APIStatusError):
+            if err.status_code not in self.retry_status_codes:
+                return None
+            retry_after = self.parse_retry_after(err.response.headers)
+            if retry_after is not None:
+                return retry_after
+        elif not isinstance(err, APIConnectionError):
+            return None
+        # exponential backoff with full jitter
+        return random.uniform(0, min(self.retry_max_backoff, self.retry_backoff * 2 ** (attempt - 1)) / 1000)
+
+    @classmethod
+    def parse_retry_after(cls, headers: Headers) -> float | None:
+        try:
+            if headers.get("retry-after-ms"):
+                return float(headers["retry-after-ms"]) / 1000
+            retry_after = headers.get("retry-after")
+            if not retry_after:
+                return None
+            try:
+                return float(retry_after)
+            except ValueError:
+                return max((parsedate_to_datetime(retry_after) - timezone.now()).total_seconds(), 0)
+        except (TypeError, ValueError):
+            return None
+
+    async def request_endpoints(self, hedge_delay: float | None) -> UpstreamResponse:
+        """
+        request endpoints in order, fail over to next one before first token yielded
+        """
+
+        endpoints = await endpoint_router.select(self.endpoints)
+        tried = set()
+        last_error = None
+        for index, endpoint in enumerate(endpoints):
+            if endpoint.key in tried:
+                continue
+            has_fallback = index < len(endpoints) - 1
+            try:
+                if index == 0 and hedge_delay is not None:
+                    alternate = endpoints[1] if has_fallback else endpoint
+                    return await self.request_hedged(
+                        primary=endpoint, alternate=alternate, hedge_delay=hedge_delay, started=tried
+                    )
+                return await self.attempt_endpoint(endpoint)
+            except Exception as err:  # pylint: disable=W0718
+                if not endpoint_router.is_endpoint_error(err):
+                    raise err
+                logger.warning("[UpstreamEndpointFailed] %s %s %s", self.model, endpoint.base_url, err)
+                if has_fallback:
+                    await self.report_metric(name=PrometheusMetrics.UPSTREAM_FAILOVER, value=1)
+                last_error = err
+            finally:
+                tried.add(endpoint.key)
+        raise last_error
+
+    async def request_hedged(
+        self, primary: UpstreamEndpoint, alternate: UpstreamEndpoint, hedge_delay: float, started: set[str]
+    ) -> UpstreamResponse:
+        """
+        send a second request when first token is late, the first one producing content wins
+        keys of endpoints actually requested are added to started
+        """
+
+        started.add(primary.key)
+        tasks = [asyncio.create_task(self.attempt_endpoint(primary))]
+        winner = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if done:
+                winner = tasks[0]
+                return winner.result()
+            logger.info("[UpstreamHedge] %s %s %s", self.model, primary.base_url, alternate.base_url)
+            started.add(alternate.key)
+            tasks.append(asyncio.create_task(self.attempt_endpoint(alternate)))
+            await self.report_metric(name=PrometheusMetrics.UPSTREAM_HEDGE, value=1)
+            pending = set(tasks)
+            last_error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        await self.report_metric(name=PrometheusMetrics.UPSTREAM_HEDGE_WIN, value=int(task is tasks[1]))
+                        return winner.result()
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            # cancel the loser, and close its stream if it has also started
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for task in tasks:
+                if task is not winner and not task.cancelled() and task.exception() is None:
+                    await task.result().close()
+
+    async def attempt_endpoint(self, endpoint: UpstreamEndpoint) -> UpstreamResponse:
+        req_time = PrometheusExporter.current_ts()
+        try:
+            response = await self.request_endpoint(endpoint)
+        except Exception as err:
+            if endpoint_router.is_endpoint_error(err):
+                await endpoint_router.report_failure(endpoint)
+            raise err
+        await endpoint_router.report_success(endpoint, ttft=PrometheusExporter.current_ts() - req_time)
+        return response
+
+    async def load_hedge_delay(self) -> float | None:
+        """
+        hedge delay in seconds, use recent ttft percentile when not configured
+        """
+
+        if not self.hedge_enabled:
+            return None
+        if self.hedge_delay:
+            return self.hedge_delay / 1000
+        hedge_delay = await endpoint_router.load_ttft_percentile(
+            model=self.model, percentile=settings.UPSTREAM_HEDGE_PERCENTILE
+        )
+        return (hedge_delay or settings.UPSTREAM_HEDGE_DEFAULT_DELAY) / 1000
+
+    async def request_endpoint(self, endpoint: UpstreamEndpoint) -> UpstreamResponse:
+        client = await openai_client_pool.acquire(
+            base_url=endpoint.base_url, api_key=endpoint.api_key, proxy=endpoint.proxy, timeout=self.timeout
+        )
+        response = UpstreamResponse(client=client)
+        params = {
+            "model": endpoint.api_model or self.api_model,
+            "messages": [message.model_dump(exclude_none=True) for message in self.messages],
+            "stream": self.use_stream,
+            "timeout": self.timeout,
+            "stream_options": {"include_usage": True} if self.use_stream else None,
+            "extra_headers": {
+                "HTTP-Referer": settings.PROJECT_URL,
+                "X-Title": settings.PROJECT_NAME,
+                **self.extra_headers,
+            },
+            "extra_query": self.extra_query,
+            "extra_body": self.extra_body,
+            **self.extra_chat_params,
+        }
+        try:
+            if self.use_stream and self.raw_stream:
+                # parse sse body directly, skip building sdk models for each chunk
+                raw_response = await client.chat.completions.with_raw_response.create(**params)
+                stream = RawChunkStream(cast_to=dict, response=raw_response.http_response, client=client)
+            else:
+                stream = await client.chat.completions.create(**params)
+            if not self.use_stream:
+                response.chunks.append(stream)
+                return response
+            # read ahead until first token, so endpoint errors before it can still fail over
+            response.stream = stream
+            response.iterator = aiter(stream)
+            async for chunk in response.iterator:
+                response.chunks.append(chunk)
+                if self.has_content(chunk):
+                    break
+            return response
+        except BaseException as err:
+            await response.close()
+            raise err
+
+    def has_content(self, chunk: ChatCompletionChunk) -> bool:
+        if not chunk.choices:
+            return False
+        delta = chunk.choices[0].delta
+        return bool(delta.content or (self.thinking_key and getattr(delta, self.thinking_key, None)))
+
+    async def parse_response(self, response, image_count, req_time) -> any:
         prompt_tokens = 0
         completion_tokens = 0
         is_first_letter = True
         first_letter_time = PrometheusExporter.current_ts()
         think_status = ThinkStatus.NOT_START
+        received_content = []
+        slot_renewed_at = PrometheusExporter.current_ts()
         with self.start_span(SpanType.CHUNK, SpanKind.SERVER):
-            for chunk in response:
-                if chunk.choices:
-                    content = chunk.choices[0].delta.content if self.use_stream else chunk.choices[0].message.content
-                    if is_first_letter and content:
-                        is_first_letter = False
-                        first_letter_time = PrometheusExporter.current_ts()
-                        self.report_metric(name=PrometheusMetrics.WAIT_FIRST_LETTER, value=first_letter_time - req_time)
-                    if content:
-                        data, reasoning_content, think_status = self.parse_think_tag(
-                            chunk=content, think_status=think_status
-                        )
-                        if data or reasoning_content:
-                            yield format_response(log_id=self.log.id, data=data, thinking=reasoning_content)
-                    elif self.thinking_key:
-                        # reasoning content
-                        reasoning_content = (
-                            getattr(chunk.choices[0].delta, self.thinking_key, "")
-                            if self.use_stream
-                            else getattr(chunk.choices[0].message, self.thinking_key, "")
+            try:
+                async for chunk in self.iter_chunks(response):
+                    # keep holding upstream slot while streaming
+                    if (
+                        PrometheusExporter.current_ts() - slot_renewed_at
+                        > settings.UPSTREAM_LIMITER_RENEW_INTERVAL * 1000
+                    ):
+                        slot_renewed_at = PrometheusExporter.current_ts()
+                        await self.renew_slot()
+                    if chunk.choices:
+                        content = (
+                            chunk.choices[0].delta.content if self.use_stream else chunk.choices[0].message.content
                         )
-                        if reasoning_content:
-                            yield format_response(log_id=self.log.id, thinking=reasoning_content)
-                if chunk.usage:
-                    prompt_tokens, completion_tokens = self.get_tokens(chunk.usage)
-                if chunk.id and not self.log.chat_id:
-                    self.log.chat_id = chunk.id
+                        if is_first_letter and content:
+                            is_first_letter = False
+                            first_letter_time = PrometheusExporter.current_ts()
+                            await self.report_metric(
+                                name=PrometheusMetrics.WAIT_FIRST_LETTER, value=first_letter_time - req_time
+                            )
+                            if self.hedge_enabled:
+                                await endpoint_router.record_ttft(model=self.model, ttft=first_letter_time - req_time)
+                        if content:
+                            data, reasoning_content, think_status = self.parse_think_tag(
+                                chunk=content, think_status=think_status
+                            )
+                            if data or reasoning_content:
+                                received_content.append(content)
+                                yield format_response(log_id=self.log.id, data=data, thinking=reasoning_content)
+                        elif self.thinking_key:
+                            # reasoning content
+                            reasoning_content = (
+                                getattr(chunk.choices[0].delta, self.thinking_key, "")
+                                if self.use_stream
+                                else getattr(chunk.choices[0].message, self.thinking_key, "")
+                            )
+                            if reasoning_content:
+                                received_content.append(reasoning_content)
+                                yield format_response(log_id=self.log.id, thinking=reasoning_content)
+                    if chunk.usage:
+                        prompt_tokens, completion_tokens = self.get_tokens(chunk.usage)
+                    if chunk.id and not self.log.chat_id:
+                        self.log.chat_id = chunk.id
+            except (asyncio.CancelledError, GeneratorExit):
+                # client has gone, stop pulling from upstream and bill what has been received
+                logger.warning("[ChatAborted] LogID: %s; Received: %d", self.log.id, len(received_content))
+                await self.close_response(response)
+                if not completion_tokens:
+                    prompt_tokens = self.estimate_prompt_tokens()
+                    completion_tokens = self.tokenizer.count("".join(received_content))
+                await database_sync_to_async(self.record)(
+                    prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, vision_count=image_count
+                )
+                raise
         finish_chat_time = PrometheusExporter.current_ts()
-        self.record(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, vision_count=image_count)
-        self.report_metric(
+        await database_sync_to_async(self.record)(
+            prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, vision_count=image_count
+        )
+        await self.report_metric(
             name=PrometheusMetrics.TOKEN_PER_SECOND,
             value=math.ceil(completion_tokens / max(finish_chat_time - first_letter_time, 1) * 1000),
         )
-        self.report_metric(name=PrometheusMetrics.PROMPT_TOKEN, value=prompt_tokens)
-        self.report_metric(name=PrometheusMetrics.COMPLETION_TOKEN, value=completion_tokens)
+        await self.report_metric(name=PrometheusMetrics.PROMPT_TOKEN, value=prompt_tokens)
+        await self.report_metric(name=PrometheusMetrics.COMPLETION_TOKEN, value=completion_tokens)
+
+    async def close_response(self, response) -> None:
+        if isinstance(response, UpstreamResponse):
+            try:
+                await response.close()
+            except Exception as err:  # pylint: disable=W0718
+                logger.warning("[CloseResponseFailed] %s", err)
+
+    async def iter_chunks(self, response) -> any:
+        if isinstance(response, list):
+            for chunk in response:
+                yield chunk
+            return
+        async for chunk in response:
+            yield chunk
 
     def parse_think_tag(self, chunk: str, think_status: int) -> (str, str, int):
         match think_status:
@@ -253,18 +832,19 @@ class OpenAIBaseClient(BaseClient, abc.ABC):
             case ThinkStatus.COMPLETED:
                 return chunk, "", ThinkStatus.COMPLETED
 
-    def report_metric(self, name: str, value: float) -> None:
-        PrometheusExporter(
+    async def report_metric(self, name: str, value: float) -> None:
+        exporter = PrometheusExporter(
             name=name,
             samples=[(None, value)],
             labels=[
                 (PrometheusLabels.MODEL_NAME, self.model),
                 (PrometheusLabels.HOSTNAME, PrometheusExporter.hostname()),
             ],
-        ).export()
+        )
+        await sync_to_async(exporter.export, thread_sensitive=False)()
 
-    def format_message(self) -> int:
-        image_count = 0
+    async def format_message(self) -> int:
+        image_contents = []
         for message in self.messages:
             message: Message
             if not isinstance(message.content, list):
@@ -273,19 +853,34 @@ class OpenAIBaseClient(BaseClient, abc.ABC):
                 content: MessageContent
                 if content.type != MessageContentType.IMAGE_URL or not content.image_url:
                     continue
-                content.image_url.url = self.convert_url_to_base64(content.image_url.url)
-                image_count += 1
-        return image_count
+                image_contents.append(content)
+        if not image_contents:
+            return 0
+        with self.start_span(SpanType.FETCH, SpanKind.CLIENT):
+            image_urls = await self.convert_urls_to_base64([content.image_url.url for content in image_contents])
+        for content, image_url in zip(image_contents, image_urls):
+            content.image_url.url = image_url
+        return len(image_contents)
+
+    async def convert_urls_to_base64(self, urls: list[str]) -> list[str]:
+        # load from cache
+        variant = f"{self.vision_max_edge}:{self.vision_quality}:{self.vision_format}"
+        image_urls = await image_cache.get_many(urls, variant=variant)
+        missing_urls = list({url for url, image_url in zip(urls, image_urls) if image_url is None})
+        if not missing_urls:
+            return image_urls
+        # load from remote
+        images = await image_loader.load_many(missing_urls)
+        # downscale and recompress
+        images = await image_processor.process_many(
+            images, max_edge=self.vision_max_edge, quality=self.vision_quality, image_format=self.vision_format
+        )
+        loaded = {url: self.convert_image_to_base64(*image) for url, image in zip(missing_urls, images)}
+        await image_cache.set_many(loaded, variant=variant)
+        return [image_url or loaded[url] for url, image_url in zip(urls, image_urls)]
 
-    def convert_url_to_base64(self, url: str) -> str:
-        client = Client(http2=True, timeout=settings.LOAD_IMAGE_TIMEOUT)
-        try:
-            response = client.get(url)
-            if response.status_code == 200:
-                return f"data:image/webp;base64,{base64.b64encode(response.content).decode()}"
-            raise FileExtractFailed(gettext("Parse Image To Base64 Failed"))
-        finally:
-            client.close()
+    def convert_image_to_base64(self, image: bytes, mime: str) -> str:
+        return f"data:{mime};base64,{base64.b64encode(image).decode()}"
 
     def get_tokens(self, usage: CompletionUsage) -> (int, int):
         return (
@@ -0,0 +1,236 @@
+import asyncio
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext
+from django_redis.client import DefaultClient
+from httpx import AsyncClient, Limits
+from ovinc_client.core.logger import logger
+from PIL import Image, ImageOps
+
+from apps.chat.exceptions import FileExtractFailed, LoadImageFailed
+from apps.cos.utils import TCloudUrlParser
+
+cache: DefaultClient
+
+
+class ImageLoader:
+    """
+    Load images through a shared keep-alive connection pool
+    """
+
+    def __init__(self) -> None:
+        self._client: AsyncClient | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    @property
+    def client(self) -> AsyncClient:
+        # connections are bound to event loop
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = AsyncClient(
+                http2=True,
+                timeout=settings.LOAD_IMAGE_TIMEOUT,
+                limits=Limits(
+                    max_connections=settings.LOAD_IMAGE_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.LOAD_IMAGE_MAX_CONNECTIONS,
+                ),
+            )
+            self._loop = loop
+        return self._client
+
+    async def load(self, url: str) -> bytes:
+        try:
+            async with asyncio.timeout(settings.LOAD_IMAGE_TIMEOUT):
+                return await self.fetch(url)
+        except TimeoutError as err:
+            logger.warning("[LoadImageTimeout] %s", url)
+            raise LoadImageFailed() from err
+
+    async def fetch(self, url: str) -> bytes:
+        async with self.client.stream("GET", url) as response:
+            if response.status_code != 200:
+                raise FileExtractFailed(gettext("Parse Image To Base64 Failed"))
+            if int(response.headers.get("content-length") or 0) > settings.LOAD_IMAGE_MAX_SIZE:
+                raise LoadImageFailed(gettext("Image Too Large"))
+            content = bytearray()
+            async for chunk in response.aiter_bytes():
+                content.extend(chunk)
+                if len(content) > settings.LOAD_IMAGE_MAX_SIZE:
+                    raise LoadImageFailed(gettext("Image Too Large"))
+            return bytes(content)
+
+    async def load_many(self, urls: list[str]) -> list[bytes]:
+        """
+        load images concurrently, bounded by concurrency limit and total deadline
+        """
+
+        semaphore = asyncio.Semaphore(settings.LOAD_IMAGE_CONCURRENCY)
+
+        async def _load(url: str) -> bytes:
+            async with semaphore:
+                return await self.load(url)
+
+        tasks = [asyncio.create_task(_load(url)) for url in urls]
+        try:
+            async with asyncio.timeout(settings.LOAD_IMAGE_TOTAL_TIMEOUT):
+                return await asyncio.gather(*tasks)
+        except TimeoutError as err:
+            logger.warning("[LoadImageTimeout] Total: %d", len(urls))
+            raise LoadImageFailed() from err
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class ImageProcessor:
+    """
+    Downscale and recompress images before sending to vision models
+    """
+
+    default_mime = "image/webp"
+    supported_mimes = ["image/jpeg", "image/png", "image/webp", "image/gif"]
+
+    def __init__(self) -> None:
+        self._executor: ThreadPoolExecutor | None = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=settings.VISION_IMAGE_PROCESS_WORKERS, thread_name_prefix="image-processor"
+            )
+        return self._executor
+
+    async def process_many(
+        self, images: list[bytes], max_edge: int, quality: int, image_format: str
+    ) -> list[tuple[bytes, str]]:
+        # run in worker pool to keep event loop free
+        loop = asyncio.get_running_loop()
+        return await asyncio.gather(
+            *[
+                loop.run_in_executor(self.executor, self.process, image, max_edge, quality, image_format)
+                for image in images
+            ]
+        )
+
+    def process(self, content: bytes, max_edge: int, quality: int, image_format: str) -> tuple[bytes, str]:
+        try:
+            with Image.open(BytesIO(content)) as image:
+                mime = Image.MIME.get(image.format, self.default_mime)
+                # animated image cannot be recompressed as single frame
+                if getattr(image, "is_animated", False):
+                    return content, mime
+                need_resize = 0 < max_edge < max(image.size)
+                if (
+                    not need_resize
+                    and mime in self.supported_mimes
+                    and len(content) <= settings.VISION_IMAGE_RECOMPRESS_SIZE
+                ):
+                    return content, mime
+                return self.encode(
+                    image=image, max_edge=max_edge if need_resize else 0, quality=quality, image_format=image_format
+                )
+        except Exception as err:  # pylint: disable=W0718
+            logger.warning("[ProcessImageFailed] %s", err)
+            return content, self.default_mime
+
+    def encode(self, image: Image.Image, max_edge: int, quality: int, image_format: str) -> tuple[bytes, str]:
+        image = ImageOps.exif_transpose(image)
+        if max_edge:
+            image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+        image_format = image_format.upper()
+        if image_format == "JPEG" and image.mode != "RGB":
+            image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+        with BytesIO() as buffer:
+            image.save(buffer, format=image_format, quality=quality)
+            return buffer.getvalue(), Image.MIME[image_format]
+
+
+class ImageCache:
+    """
+    Two-tier cache (in-process lru + redis) for encoded images
+    keyed by cos object path and processing variant, so re-signed urls of the same object share one entry
+    """
+
+    cache_key_format = "image-base64:{key_hash}"
+
+    def __init__(self) -> None:
+        self._local: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._local_size = 0
+
+    def build_key(self, url: str, variant: str) -> str | None:
+        object_key = TCloudUrlParser.get_object_key(url)
+        if not object_key:
+            return None
+        return self.cache_key_format.format(key_hash=sha256(f"{object_key}:{variant}".encode()).hexdigest())
+
+    async def get_many(self, urls: list[str], variant: str) -> list[str | None]:
+        keys = [self.build_key(url, variant) for url in urls]
+        results = {key: self.get_local(key) for key in keys if key}
+        # load missing from redis
+        missing_keys = [key for key, value in results.items() if value is None]
+        if missing_keys:
+            try:
+                loaded = await cache.aget_many(missing_keys)
+            except Exception as err:  # pylint: disable=W0718
+                logger.warning("[LoadImageCacheFailed] %s %s", missing_keys, err)
+                loaded = {}
+            for key, value in loaded.items():
+                results[key] = value
+                self.set_local(key, value)
+        return [results.get(key) if key else None for key in keys]
+
+    async def set_many(self, data: dict[str, str], variant: str) -> None:
+        values = {}
+        for url, value in data.items():
+            key = self.build_key(url, variant)
+            if not key or len(value) > settings.IMAGE_CACHE_MAX_ITEM_SIZE:
+                continue
+            values[key] = value
+            self.set_local(key, value)
+        if values:
+            try:
+                await cache.aset_many(values, timeout=settings.IMAGE_CACHE_TIMEOUT)
+            except Exception as err:  # pylint: disable=W0718
+                logger.warning("[SaveImageCacheFailed] %s %s", list(values), err)
+
+    def get_local(self, key: str) -> str | None:
+        item = self._local.get(key)
+        if item is None:
+            return None
+        value, expired_at = item
+        if expired_at < time.monotonic():
+            self.pop_local(key)
+            return None
+        self._local.move_to_end(key)
+        return value
+
+    def set_local(self, key: str, value: str) -> None:
+        if len(value) > settings.IMAGE_CACHE_LOCAL_MAX_SIZE:
+            return
+        self.pop_local(key)
+        self._local[key] = (value, time.monotonic() + settings.IMAGE_CACHE_TIMEOUT)
+        self._local_size += len(value)
+        # evict least recently used
+        while self._local_size > settings.IMAGE_CACHE_LOCAL_MAX_SIZE:
+            self.pop_local(next(iter(self._local)))
+
+    def pop_local(self, key: str) -> None:
+        item = self._local.pop(key, None)
+        if item is not None:
+            self._local_size -= len(item[0])
+
+
+image_loader = ImageLoader()
+image_processor = ImageProcessor()
+image_cache = ImageCache()
@@ -0,0 +1,148 @@
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django_redis.client import DefaultClient
+from ovinc_client.core.logger import logger
+from redis import Redis
+
+from apps.chat.constants import (
+    MODEL_SLOT_HOLDERS_KEY,
+    MODEL_SLOT_QUEUE_KEY,
+    MODEL_SLOT_USERS_KEY,
+    MODEL_SLOT_WAITERS_KEY,
+)
+
+cache: DefaultClient
+
+# fair queue: priority is the virtual finish time of each user,
+# so a user sending many chats at once gets interleaved with others instead of blocking them
+ENQUEUE_SCRIPT = """
+local now = tonumber(ARGV[3])
+if redis.call("ZCARD", KEYS[1]) >= tonumber(ARGV[4]) then
+    return -1
+end
+local last = tonumber(redis.call("HGET", KEYS[3], ARGV[2]) or "0")
+local priority = math.max(now, last) + tonumber(ARGV[5])
+redis.call("HSET", KEYS[3], ARGV[2], priority)
+redis.call("ZADD", KEYS[1], priority, ARGV[1])
+redis.call("ZADD", KEYS[2], now, ARGV[1])
+for _, key in ipairs(KEYS) do
+    redis.call("EXPIRE", key, tonumber(ARGV[6]))
+end
+return redis.call("ZCARD", KEYS[1])
+"""
+
+# take a slot when in front of the queue, otherwise refresh heartbeat and return queue position
+# expired holders and waiters without heartbeat are dropped, so crashed workers never leak slots
+ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[2])
+redis.call("ZREMRANGEBYSCORE", KEYS[1], "-inf", now)
+local stale = redis.call("ZRANGEBYSCORE", KEYS[3], "-inf", now - tonumber(ARGV[5]))
+for _, token in ipairs(stale) do
+    redis.call("ZREM", KEYS[2], token)
+    redis.call("ZREM", KEYS[3], token)
+end
+local rank = redis.call("ZRANK", KEYS[2], ARGV[1])
+if not rank then
+    return -1
+end
+local free = tonumber(ARGV[3]) - redis.call("ZCARD", KEYS[1])
+if rank < free then
+    redis.call("ZREM", KEYS[2], ARGV[1])
+    redis.call("ZREM", KEYS[3], ARGV[1])
+    redis.call("ZADD", KEYS[1], now + tonumber(ARGV[4]), ARGV[1])
+    redis.call("EXPIRE", KEYS[1], tonumber(ARGV[4]))
+    return 0
+end
+redis.call("ZADD", KEYS[3], now, ARGV[1])
+return rank - math.max(free, 0) + 1
+"""
+
+
+class ConcurrencyLimiter:
+    """
+    Distributed per-model upstream concurrency limiter, slots and wait queue are shared across workers through redis
+    """
+
+    def __init__(self) -> None:
+        self.redis: Redis = cache.client.get_client()
+        self.enqueue_script = self.redis.register_script(ENQUEUE_SCRIPT)
+        self.acquire_script = self.redis.register_script(ACQUIRE_SCRIPT)
+
+    async def enqueue(self, model: str, user: str, token: str, queue_size: int) -> int:
+        """
+        join the wait queue, return queue depth or -1 when queue is full
+        """
+
+        return await sync_to_async(self.enqueue_script, thread_sensitive=False)(
+            keys=[
+                MODEL_SLOT_QUEUE_KEY.format(model),
+                MODEL_SLOT_WAITERS_KEY.format(model),
+                MODEL_SLOT_USERS_KEY.format(model),
+            ],
+            args=[
+                token,
+                user,
+                time.time(),
+                queue_size,
+                settings.UPSTREAM_LIMITER_FAIR_INTERVAL,
+                settings.UPSTREAM_LIMITER_QUEUE_TIMEOUT,
+            ],
+        )
+
+    async def acquire(self, model: str, token: str, capacity: int) -> int:
+        """
+        return 0 when slot acquired, queue position when still waiting, -1 when dropped from queue
+        """
+
+        return await sync_to_async(self.acquire_script, thread_sensitive=False)(
+            keys=[
+                MODEL_SLOT_HOLDERS_KEY.format(model),
+                MODEL_SLOT_QUEUE_KEY.format(model),
+                MODEL_SLOT_WAITERS_KEY.format(model),
+            ],
+            args=[
+                token,
+                time.time(),
+                capacity,
+                settings.UPSTREAM_LIMITER_LEASE,
+                settings.UPSTREAM_LIMITER_HEARTBEAT_TIMEOUT,
+            ],
+        )
+
+    async def renew(self, model: str, token: str) -> bool:
+        """
+        extend lease of a held slot, return False when slot already lost
+        """
+
+        return await sync_to_async(self.extend, thread_sensitive=False)(model=model, token=token)
+
+    def extend(self, model: str, token: str) -> bool:
+        key = MODEL_SLOT_HOLDERS_KEY.format(model)
+        try:
+            pipeline = self.redis.pipeline(transaction=False)
+            # only existing holders, an expired slot may have been taken by others
+            pipeline.zadd(key, {token: time.time() + settings.UPSTREAM_LIMITER_LEASE}, xx=True, ch=True)
+            pipeline.expire(key, settings.UPSTREAM_LIMITER_LEASE)
+            return bool(pipeline.execute()[0])
+        except Exception as err:  # pylint: disable=W0718
+            logger.warning("[RenewSlotFailed] %s %s %s", model, token, err)
+            return True
+
+    async def release(self, model: str, token: str) -> None:
+        await sync_to_async(self.remove, thread_sensitive=False)(model=model, token=token)
+
+    def remove(self, model: str, token: str) -> None:
+        try:
+            pipeline = self.redis.pipeline(transaction=False)
+            pipeline.zrem(MODEL_SLOT_HOLDERS_KEY.format(model), token)
+            pipeline.zrem(MODEL_SLOT_QUEUE_KEY.format(model), token)
+            pipeline.zrem(MODEL_SLOT_WAITERS_KEY.format(model), token)
+            pipeline.execute()
+        except Exception as err:  # pylint: disable=W0718
+            logger.warning("[ReleaseSlotFailed] %s %s %s", model, token, err)
+
+
+concurrency_limiter = ConcurrencyLimiter()
@@ -1,6 +1,7 @@
-from httpx import Client
+from decimal import Decimal
 
 from apps.chat.client.base import OpenAIBaseClient
+from apps.chat.models import UpstreamEndpoint
 
 
 class OpenAIClient(OpenAIBaseClient):
@@ -17,11 +18,15 @@ class OpenAIClient(OpenAIBaseClient):
         return self.model_settings.get("base_url")
 
     @property
-    def http_client(self) -> Client | None:
-        proxy = self.model_settings.get("proxy")
-        if proxy:
-            return Client(proxy=proxy)
-        return None
+    def proxy(self) -> str | None:
+        return self.model_settings.get("proxy", super().proxy)
+
+    @property
+    def endpoints(self) -> list[UpstreamEndpoint]:
+        endpoints = self.model_settings.get("endpoints")
+        if endpoints:
+            return [UpstreamEndpoint(**endpoint) for endpoint in endpoints]
+        return super().endpoints
 
     @property
     def timeout(self) -> int:
@@ -54,3 +59,81 @@ class OpenAIClient(OpenAIBaseClient):
     @property
     def thinking_key(self) -> str:
         return self.model_settings.get("thinking_key", super().thinking_key)
+
+    @property
+    def concurrency(self) -> int:
+        return self.model_settings.get("concurrency", super().concurrency)
+
+    @property
+    def queue_size(self) -> int:
+        return self.model_settings.get("queue_size", super().queue_size)
+
+    @property
+    def raw_stream(self) -> bool:
+        return self.model_settings.get("raw_stream", super().raw_stream)
+
+    @property
+    def tokenizer_name(self) -> str:
+        return self.model_settings.get("tokenizer", super().tokenizer_name)
+
+    @property
+    def max_context_tokens(self) -> int:
+        return self.model_settings.get("max_context_tokens", super().max_context_tokens)
+
+    @property
+    def reserved_completion_tokens(self) -> int:
+        return self.model_settings.get("reserved_completion_tokens", super().reserved_completion_tokens)
+
+    @property
+    def response_cache_enabled(self) -> bool:
+        return self.model_settings.get("response_cache_enabled", super().response_cache_enabled)
+
+    @property
+    def response_cache_timeout(self) -> int:
+        return self.model_settings.get("response_cache_timeout", super().response_cache_timeout)
+
+    @property
+    def response_cache_price_rate(self) -> Decimal:
+        if "response_cache_price_rate" in self.model_settings:
+            return Decimal(str(self.model_settings["response_cache_price_rate"]))
+        return super().response_cache_price_rate
+
+    @property
+    def retry_status_codes(self) -> list[int]:
+        return self.model_settings.get("retry_status_codes", super().retry_status_codes)
+
+    @property
+    def retry_max_attempts(self) -> int:
+        return self.model_settings.get("retry_max_attempts", super().retry_max_attempts)
+
+    @property
+    def retry_backoff(self) -> int:
+        return self.model_settings.get("retry_backoff", super().retry_backoff)
+
+    @property
+    def retry_max_backoff(self) -> int:
+        return self.model_settings.get("retry_max_backoff", super().retry_max_backoff)
+
+    @property
+    def retry_deadline(self) -> int:
+        return self.model_settings.get("retry_deadline", super().retry_deadline)
+
+    @property
+    def hedge_enabled(self) -> bool:
+        return self.model_settings.get("hedge_enabled", super().hedge_enabled)
+
+    @property
+    def hedge_delay(self) -> int | None:
+        return self.model_settings.get("hedge_delay", super().hedge_delay)
+
+    @property
+    def vision_max_edge(self) -> int:
+        return self.model_settings.get("vision_max_edge", super().vision_max_edge)
+
+    @property
+    def vision_quality(self) -> int:
+        return self.model_settings.get("vision_quality", super().vision_quality)
+
+    @property
+    def vision_format(self) -> str:
+        return self.model_settings.get("vision_format", super().vision_format)
@@ -0,0 +1,134 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator
+
+from django.conf import settings
+from httpx import AsyncClient, Limits
+from openai import AsyncOpenAI, AsyncStream
+from ovinc_client.core.logger import logger
+
+
+@dataclass
+class PooledClient:
+    """
+    Pooled Client
+    """
+
+    client: AsyncOpenAI
+    loop: asyncio.AbstractEventLoop
+    last_used: float
+    in_use: int = 0
+
+
+class OpenAIClientPool:
+    """
+    Process-wide registry of keep-alive upstream clients
+    keyed by (base_url, api_key, proxy, timeout), so changed model settings build a new client
+    """
+
+    def __init__(self) -> None:
+        self._clients: dict[tuple, PooledClient] = {}
+        # clients replaced while still in use, closed once released
+        self._retired: list[PooledClient] = []
+
+    async def acquire(self, base_url: str, api_key: str, proxy: str | None, timeout: int) -> AsyncOpenAI:
+        await self.evict_idle()
+        key = (base_url, api_key, proxy, timeout)
+        loop = asyncio.get_running_loop()
+        pooled = self._clients.get(key)
+        # connections are bound to event loop
+        if pooled is None or pooled.loop is not loop:
+            if pooled is not None:
+                self.retire(pooled)
+            pooled = PooledClient(client=self.build_client(*key), loop=loop, last_used=time.monotonic())
+            self._clients[key] = pooled
+            logger.info("[OpenAIClientPool] Build Client: %s; Total: %d", base_url, len(self._clients))
+        pooled.in_use += 1
+        pooled.last_used = time.monotonic()
+        return pooled.client
+
+    async def release(self, client: AsyncOpenAI) -> None:
+        for pooled in [*self._clients.values(), *self._retired]:
+            if pooled.client is not client:
+                continue
+            pooled.in_use = max(pooled.in_use - 1, 0)
+            pooled.last_used = time.monotonic()
+            if not pooled.in_use and pooled in self._retired:
+                self._retired.remove(pooled)
+                await self.close_client(pooled)
+            return
+
+    def retire(self, pooled: PooledClient) -> None:
+        """
+        close client of another event loop on its own loop, deferred to release while in use
+        """
+
+        if pooled.in_use:
+            self._retired.append(pooled)
+            return
+        # connections of a stopped loop cannot be closed gracefully, they are dropped with the client
+        if pooled.loop.is_running():
+            asyncio.run_coroutine_threadsafe(self.close_client(pooled), pooled.loop)
+
+    async def evict_idle(self) -> None:
+        now = time.monotonic()
+        for key, pooled in list(self._clients.items()):
+            if pooled.in_use or now - pooled.last_used < settings.OPENAI_CLIENT_IDLE_TIMEOUT:
+                continue
+            self._clients.pop(key, None)
+            await self.close_client(pooled)
+
+    async def close_client(self, pooled: PooledClient) -> None:
+        try:
+            await pooled.client.close()
+        except Exception as err:  # pylint: disable=W0718
+            logger.warning("[OpenAIClientPool] Close Client Failed: %s", err)
+
+    def build_client(self, base_url: str, api_key: str, proxy: str | None, timeout: int) -> AsyncOpenAI:
+        http_client = AsyncClient(
+            http2=True,
+            proxy=proxy or None,
+            timeout=timeout,
+            limits=Limits(
+                max_connections=settings.OPENAI_CLIENT_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.OPENAI_CLIENT_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.OPENAI_CLIENT_KEEPALIVE_EXPIRY,
+            ),
+        )
+        # retries are handled by client with failover and backoff
+        return AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0, http_client=http_client)
+
+
+openai_client_pool = OpenAIClientPool()
+
+
+class UpstreamResponse:
+    """
+    Upstream response holding the pooled client until closed
+    chunks read ahead before the first token are replayed first
+    """
+
+    def __init__(self, client: AsyncOpenAI) -> None:
+        self.client = client
+        self.chunks: list = []
+        self.stream: AsyncStream | None = None
+        self.iterator: AsyncIterator | None = None
+        self.is_closed = False
+
+    async def __aiter__(self) -> AsyncIterator:
+        for chunk in self.chunks:
+            yield chunk
+        if self.iterator is not None:
+            async for chunk in self.iterator:
+                yield chunk
+
+    async def close(self) -> None:
+        if self.is_closed:
+            return
+        self.is_closed = True
+        try:
+            if self.stream is not None:
+                await self.stream.close()
+        finally:
+            await openai_client_pool.release(self.client)
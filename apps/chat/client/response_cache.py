@@ -0,0 +1,39 @@
+import json
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.cache import cache
+from django_redis.client import DefaultClient
+from ovinc_client.core.logger import logger
+
+cache: DefaultClient
+
+
+class ResponseCache:
+    """
+    Exact-match cache of complete responses, keyed by canonical hash of request
+    """
+
+    cache_key_format = "response-cache:{key_hash}"
+
+    def build_key(self, payload: dict) -> str:
+        content = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+        return self.cache_key_format.format(key_hash=sha256(content.encode()).hexdigest())
+
+    async def get(self, key: str) -> dict | None:
+        try:
+            return await cache.aget(key)
+        except Exception as err:  # pylint: disable=W0718
+            logger.warning("[LoadResponseCacheFailed] %s %s", key, err)
+            return None
+
+    async def set(self, key: str, value: dict, timeout: int) -> None:
+        if len(value["data"]) + len(value["thinking"]) > settings.RESPONSE_CACHE_MAX_SIZE:
+            return
+        try:
+            await cache.aset(key, value, timeout=timeout)
+        except Exception as err:  # pylint: disable=W0718
+            logger.warning("[SaveResponseCacheFailed] %s %s", key, err)
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,152 @@
+import random
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django_redis.client import DefaultClient
+from openai import APIConnectionError, APIStatusError
+from ovinc_client.core.logger import logger
+from redis import Redis
+
+from apps.chat.constants import ENDPOINT_HEALTH_KEY, MODEL_TTFT_KEY
+from apps.chat.models import UpstreamEndpoint
+
+cache: DefaultClient
+
+# ewma of ttft and error rate, open circuit after continuous failures
+UPDATE_HEALTH_SCRIPT = """
+local alpha = tonumber(ARGV[3])
+local errors = tonumber(redis.call("HGET", KEYS[1], "errors") or "0")
+if ARGV[1] == "1" then
+    local ttft = tonumber(ARGV[2])
+    local last_ttft = redis.call("HGET", KEYS[1], "ttft")
+    if last_ttft then
+        ttft = tonumber(last_ttft) * (1 - alpha) + ttft * alpha
+    end
+    redis.call("HSET", KEYS[1], "ttft", ttft, "errors", errors * (1 - alpha), "failures", 0, "open_until", 0)
+else
+    local failures = redis.call("HINCRBY", KEYS[1], "failures", 1)
+    redis.call("HSET", KEYS[1], "errors", errors * (1 - alpha) + alpha)
+    if failures >= tonumber(ARGV[4]) then
+        redis.call("HSET", KEYS[1], "open_until", tonumber(ARGV[5]) + tonumber(ARGV[6]))
+    end
+end
+redis.call("EXPIRE", KEYS[1], tonumber(ARGV[7]))
+"""
+
+
+class EndpointHealth:
+    """
+    Endpoint Health
+    """
+
+    def __init__(self, data: dict) -> None:
+        self.ttft = float(data.get(b"ttft") or 0)
+        self.errors = float(data.get(b"errors") or 0)
+        self.open_until = float(data.get(b"open_until") or 0)
+
+    @property
+    def is_open(self) -> bool:
+        return self.open_until > time.time()
+
+    def score(self, endpoint: UpstreamEndpoint) -> float:
+        return (
+            endpoint.weight
+            / (1 + self.ttft / settings.UPSTREAM_ROUTER_TTFT_BASE)
+            * max(1 - self.errors, settings.UPSTREAM_ROUTER_MIN_SCORE)
+        )
+
+
+class EndpointRouter:
+    """
+    Pick upstream endpoint by live latency and error tracking, shared across workers through redis
+    """
+
+    def __init__(self) -> None:
+        self.redis: Redis = cache.client.get_client()
+        self.update_health_script = self.redis.register_script(UPDATE_HEALTH_SCRIPT)
+
+    async def select(self, endpoints: list[UpstreamEndpoint]) -> list[UpstreamEndpoint]:
+        """
+        order endpoints for trying, weighted pick first then fallback by score, open circuits at last
+        """
+
+        if len(endpoints) <= 1:
+            return endpoints
+        healths = await sync_to_async(self.load_health, thread_sensitive=False)(endpoints)
+        available = [endpoint for endpoint in endpoints if not healths[endpoint.key].is_open]
+        opened = [endpoint for endpoint in endpoints if healths[endpoint.key].is_open]
+        if not available:
+            return opened
+        scores = {endpoint.key: healths[endpoint.key].score(endpoint) for endpoint in available}
+        first = random.choices(available, weights=[scores[endpoint.key] for endpoint in available])[0]
+        fallback = sorted(
+            [endpoint for endpoint in available if endpoint is not first],
+            key=lambda endpoint: scores[endpoint.key],
+            reverse=True,
+        )
+        return [first, *fallback, *opened]
+
+    def load_health(self, endpoints: list[UpstreamEndpoint]) -> dict[str, EndpointHealth]:
+        pipeline = self.redis.pipeline(transaction=False)
+        for endpoint in endpoints:
+            pipeline.hgetall(ENDPOINT_HEALTH_KEY.format(endpoint.key))
+        return {endpoint.key: EndpointHealth(data) for endpoint, data in zip(endpoints, pipeline.execute())}
+
+    async def report_success(self, endpoint: UpstreamEndpoint, ttft: int) -> None:
+        await sync_to_async(self.update_health, thread_sensitive=False)(endpoint=endpoint, is_success=True, ttft=ttft)
+
+    async def report_failure(self, endpoint: UpstreamEndpoint) -> None:
+        await sync_to_async(self.update_health, thread_sensitive=False)(endpoint=endpoint, is_success=False, ttft=0)
+
+    def update_health(self, endpoint: UpstreamEndpoint, is_success: bool, ttft: int) -> None:
+        try:
+            self.update_health_script(
+                keys=[ENDPOINT_HEALTH_KEY.format(endpoint.key)],
+                args=[
+                    int(is_success),
+                    ttft,
+                    settings.UPSTREAM_ROUTER_EWMA_ALPHA,
+                    settings.UPSTREAM_ROUTER_CIRCUIT_FAILURES,
+                    time.time(),
+                    settings.UPSTREAM_ROUTER_CIRCUIT_OPEN_SECONDS,
+                    settings.UPSTREAM_ROUTER_HEALTH_TIMEOUT,
+                ],
+            )
+        except Exception as err:  # pylint: disable=W0718
+            logger.warning("[UpdateEndpointHealthFailed] %s %s", endpoint.base_url, err)
+
+    async def record_ttft(self, model: str, ttft: int) -> None:
+        await sync_to_async(self.push_ttft_sample, thread_sensitive=False)(model=model, ttft=ttft)
+
+    def push_ttft_sample(self, model: str, ttft: int) -> None:
+        try:
+            key = MODEL_TTFT_KEY.format(model)
+            pipeline = self.redis.pipeline(transaction=False)
+            pipeline.lpush(key, ttft)
+            pipeline.ltrim(key, 0, settings.UPSTREAM_HEDGE_SAMPLE_SIZE - 1)
+            pipeline.expire(key, settings.UPSTREAM_ROUTER_HEALTH_TIMEOUT)
+            pipeline.execute()
+        except Exception as err:  # pylint: disable=W0718
+            logger.warning("[RecordTTFTFailed] %s %s", model, err)
+
+    async def load_ttft_percentile(self, model: str, percentile: int) -> int | None:
+        samples = await sync_to_async(self.redis.lrange, thread_sensitive=False)(MODEL_TTFT_KEY.format(model), 0, -1)
+        if len(samples) < settings.UPSTREAM_HEDGE_MIN_SAMPLES:
+            return None
+        samples = sorted(int(sample) for sample in samples)
+        return samples[min(len(samples) * percentile // 100, len(samples) - 1)]
+
+    @classmethod
+    def is_endpoint_error(cls, err: Exception) -> bool:
+        """
+        errors caused by endpoint rather than request, which are worth trying another endpoint
+        """
+
+        if isinstance(err, APIStatusError):
+            return err.status_code in settings.UPSTREAM_ROUTER_FAILOVER_STATUS_CODES
+        return isinstance(err, APIConnectionError)
+
+
+endpoint_router = EndpointRouter()
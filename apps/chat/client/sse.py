@@ -0,0 +1,47 @@
+from typing import AsyncIterator
+
+from openai import APIError, AsyncStream
+
+
+class RawObject:
+    """
+    Attribute access over decoded json, without building sdk models
+    """
+
+    __slots__ = ("_data",)
+
+    def __init__(self, data: dict) -> None:
+        self._data = data
+
+    def __getattr__(self, name: str) -> any:
+        # missing fields are none, same as optional fields of sdk models
+        value = self._data.get(name)
+        if isinstance(value, dict):
+            return RawObject(value)
+        if isinstance(value, list):
+            return [RawObject(item) if isinstance(item, dict) else item for item in value]
+        return value
+
+
+class RawChunkStream(AsyncStream):
+    """
+    Chat completion stream yielding raw chunks, reuses the sdk sse decoder and error handling
+    """
+
+    async def __stream__(self) -> AsyncIterator[RawObject]:
+        iterator = self._iter_events()
+        async for sse in iterator:
+            if sse.data.startswith("[DONE]"):
+                break
+            data = sse.json()
+            if isinstance(data, dict) and data.get("error") and sse.event in (None, "error"):
+                error = data["error"]
+                message = error.get("message") if isinstance(error, dict) else None
+                if not message or not isinstance(message, str):
+                    message = "An error occurred during streaming"
+                raise APIError(message=message, request=self.response.request, body=error)
+            if sse.event is None:
+                yield RawObject(data)
+        # ensure the entire stream is consumed
+        async for _ in iterator:
+            ...
@@ -10,6 +10,22 @@ WS_CLOSED_KEY = "ws:closed:{}"
 
 MESSAGE_CACHE_KEY = "message:{}"
 
+AI_MODEL_VERSION_KEY = "ai-model:version"
+MODEL_PERMISSION_VERSION_KEY = "model-permission:version"
+USER_MODEL_GRANTS_KEY = "user:model-grants:{version}:{user_id}"
+
+BILLING_STREAM_KEY = "billing:stream"
+BILLING_STREAM_GROUP = "billing"
+CHAT_LOG_BUFFER_KEY = "chatlog:buffer"
+
+ENDPOINT_HEALTH_KEY = "endpoint:health:{}"
+MODEL_TTFT_KEY = "model:ttft:{}"
+
+MODEL_SLOT_HOLDERS_KEY = "model:slot:holders:{}"
+MODEL_SLOT_QUEUE_KEY = "model:slot:queue:{}"
+MODEL_SLOT_WAITERS_KEY = "model:slot:waiters:{}"
+MODEL_SLOT_USERS_KEY = "model:slot:users:{}"
+
 
 class OpenAIRole(TextChoices):
     """
@@ -58,6 +74,7 @@ class SpanType(TextChoices):
     """
 
     API = "api", gettext_lazy("API")
+    ATTEMPT = "attempt", gettext_lazy("Attempt")
     CHUNK = "chunk", gettext_lazy("Chunk")
     FETCH = "fetch", gettext_lazy("Fetch")
     CHAT = "chat", gettext_lazy("Chat")
@@ -73,6 +90,16 @@ class MessageSyncAction(IntegerChoices):
     DELETE = 2, gettext_lazy("Delete")
 
 
+class RetentionPolicy(TextChoices):
+    """
+    Retention Policy
+    """
+
+    CHAT_MESSAGE_STATE = "chat-message-state", gettext_lazy("Chat Message State")
+    CHAT_MESSAGE_CHANGE_LOG = "chat-message-change-log", gettext_lazy("Chat Message Change Log")
+    CHAT_LOG = "chat-log", gettext_lazy("Chat Log")
+
+
 class ThinkStatus(IntegerChoices):
     """
     Think Status
@@ -1,13 +1,14 @@
+import asyncio
 import json
-import time
+from contextlib import aclosing
 from typing import Type
 
 from autobahn.exception import Disconnected
+from channels.db import database_sync_to_async
 from channels.exceptions import ChannelFull
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
-from django.shortcuts import get_object_or_404
 from django_redis.client import DefaultClient
 from ovinc_client.account.models import User
 from ovinc_client.core.logger import logger
@@ -17,16 +18,22 @@ from apps.chat.client.base import BaseClient
 from apps.chat.constants import WS_CLOSED_KEY, AIModelProvider
 from apps.chat.exceptions import UnexpectedProvider, VerifyFailed
 from apps.chat.models import AIModel, ChatRequest
+from apps.chat.registry import model_registry
 from apps.chat.serializers import OpenAIChatRequestSerializer
+from apps.chat.stream import coalesce_stream
 from apps.chat.utils import format_error
-from utils.consumers import WebsocketConsumer
+from utils.consumers import AsyncWebsocketConsumer
 
 USER_MODEL: User = get_user_model()
 cache: DefaultClient
 
 
-class ChatConsumer(WebsocketConsumer):
-    def receive(self, text_data=None, *args, **kwargs):
+class ChatConsumer(AsyncWebsocketConsumer):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.chat_tasks: set[asyncio.Task] = set()
+
+    async def receive(self, text_data=None, *args, **kwargs):
         # load input
         try:
             data = json.loads(text_data)
@@ -39,71 +46,99 @@ class ChatConsumer(WebsocketConsumer):
         request_data = request_serializer.validated_data
 
         # async chat
-        self.chat(request_data=self.load_data_from_cache(request_data["key"]))
+        request_data = await self.load_data_from_cache(request_data["key"])
+        chat_task = asyncio.create_task(self.chat(request_data=request_data))
+        self.chat_tasks.add(chat_task)
+        chat_task.add_done_callback(self.chat_tasks.discard)
+
+    async def disconnect(self, code):
+        await super().disconnect(code)
+        # abort running chats so upstream streams get closed immediately
+        chat_tasks = [chat_task for chat_task in self.chat_tasks if not chat_task.done()]
+        for chat_task in chat_tasks:
+            chat_task.cancel()
+        await asyncio.gather(*chat_tasks, return_exceptions=True)
 
-    def chat_send(self, data: dict):
-        self.send(text_data=json.dumps(data, ensure_ascii=False))
+    async def chat_send(self, data: dict):
+        await self.send(text_data=json.dumps(data, ensure_ascii=False))
 
-    def chat_close(self):
-        self.close()
+    async def chat_close(self):
+        await self.close()
 
-    def chat(self, request_data: ChatRequest) -> None:
+    async def chat(self, request_data: ChatRequest) -> None:
         try:
-            is_closed = self.inner_chat(request_data=request_data)
+            is_closed = await self.inner_chat(request_data=request_data)
             if is_closed:
                 return
-            self.chat_send(data={"is_finished": True})
+            await self.chat_send(data={"is_finished": True})
         except Exception as err:  # pylint: disable=W0718
             logger.exception("[ChatError] %s", err)
-            self.chat_send(data=format_error(log_id="", error=err))
-        self.chat_close()
+            await self.chat_send(data=format_error(log_id="", error=err))
+        await self.chat_close()
 
-    def inner_chat(self, request_data: ChatRequest) -> bool:
+    async def inner_chat(self, request_data: ChatRequest) -> bool:
         # model
-        model = self.get_model_inst(request_data.model)
+        model = await self.get_model_inst(request_data.model)
         # get client
         client = self.get_model_client(model)
         # check closed
-        if cache.get(WS_CLOSED_KEY.format(self.channel_name)):
+        if await cache.aget(WS_CLOSED_KEY.format(self.channel_name)):
             logger.warning("[ConnectClosedBeforeReplyStart] %s %s", self.channel_name, request_data.user)
             return True
-        # init client
-        client = client(user=request_data.user, model=request_data.model, messages=request_data.messages)
-        # response
+        # init client, balance is held until the chat is recorded
+        client = await database_sync_to_async(client)(
+            user=request_data.user, model=request_data.model, messages=request_data.messages
+        )
+        try:
+            return await self.send_chat(client=client)
+        finally:
+            # aborted before chat recorded, e.g. cancelled in audit or before stream started
+            await database_sync_to_async(client.release_balance)()
+
+    async def send_chat(self, client: BaseClient) -> bool:
         is_closed = False
-        for data in client.chat():
-            if is_closed:
-                continue
-            retry_times = 0
-            while retry_times <= settings.CHANNEL_RETRY_TIMES:
-                try:
-                    self.chat_send(data)
-                    break
-                except Disconnected:
-                    logger.warning("[SendMessageFailed-Disconnected] Channel: %s", self.channel_name)
-                    is_closed = True
-                    break
-                except ChannelFull:
-                    if cache.get(WS_CLOSED_KEY.format(self.channel_name)):
+        async with aclosing(
+            coalesce_stream(
+                stream=client.chat(),
+                max_delay=settings.CHAT_STREAM_COALESCE_DELAY / 1000,
+                max_size=settings.CHAT_STREAM_COALESCE_SIZE,
+            )
+        ) as stream:
+            async for data in stream:
+                retry_times = 0
+                while retry_times <= settings.CHANNEL_RETRY_TIMES:
+                    try:
+                        await self.chat_send(data)
+                        break
+                    except Disconnected:
                         logger.warning("[SendMessageFailed-Disconnected] Channel: %s", self.channel_name)
                         is_closed = True
                         break
-                    logger.warning(
-                        "[SendMessageFailed-ChannelFull] Channel: %s; Retry: %d;", self.channel_name, retry_times
-                    )
-                    time.sleep(settings.CHANNEL_RETRY_SLEEP)
-                retry_times += 1
+                    except ChannelFull:
+                        if await cache.aget(WS_CLOSED_KEY.format(self.channel_name)):
+                            logger.warning("[SendMessageFailed-Disconnected] Channel: %s", self.channel_name)
+                            is_closed = True
+                            break
+                        logger.warning(
+                            "[SendMessageFailed-ChannelFull] Channel: %s; Retry: %d;", self.channel_name, retry_times
+                        )
+                        await asyncio.sleep(settings.CHANNEL_RETRY_SLEEP)
+                    retry_times += 1
+                # stop pulling upstream, closing the stream aborts the completion and records usage
+                if is_closed:
+                    break
         return is_closed
 
-    def load_data_from_cache(self, key: str) -> ChatRequest:
-        request_data = cache.get(key=key)
-        cache.delete(key=key)
+    async def load_data_from_cache(self, key: str) -> ChatRequest:
+        request_data = await cache.aget(key=key)
+        await cache.adelete(key=key)
         if not request_data:
             raise VerifyFailed()
         return ChatRequest(**request_data)
 
+    @database_sync_to_async
     def get_model_inst(self, model: str) -> AIModel:
-        return get_object_or_404(AIModel, model=model)
+        return model_registry.get_model(model, is_enabled=False)
 
     # pylint: disable=R0911
     def get_model_client(self, model: AIModel) -> Type[BaseClient]:
@@ -41,3 +41,8 @@ class FileNotReady(APIException):
 class FileExtractFailed(APIException):
     status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
     default_detail = gettext_lazy("File Extract Failed")
+
+
+class ModelBusy(APIException):
+    status_code = status.HTTP_429_TOO_MANY_REQUESTS
+    default_detail = gettext_lazy("Model Busy, Please Try Again Later")
@@ -0,0 +1,81 @@
+import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Sum
+from django.utils import timezone
+
+from apps.chat.constants import PRICE_DECIMAL_NUMS, PRICE_DIGIT_NUMS
+from apps.chat.models import ChatLog, ChatUsageRollup
+
+
+class Command(BaseCommand):
+    """
+    Rebuild Chat Usage Rollup From Charged Logs
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", required=True, help="start day, YYYY-MM-DD")
+        parser.add_argument("--end", required=True, help="end day (included), YYYY-MM-DD")
+
+    def handle(self, *args, **options):
+        day = datetime.date.fromisoformat(options["start"])
+        end = datetime.date.fromisoformat(options["end"])
+        # days with purged logs can not be rebuilt, keep their rollup
+        retained_since = None
+        if settings.CHATLOG_RETAIN_DAYS > 0:
+            retained_since = timezone.localdate() - datetime.timedelta(days=settings.CHATLOG_RETAIN_DAYS - 1)
+        while day <= end:
+            if retained_since and day < retained_since:
+                self.stdout.write(self.style.WARNING(f"{day.isoformat()} skipped, logs purged"))
+                day += datetime.timedelta(days=1)
+                continue
+            total = self.rebuild_day(day)
+            self.stdout.write(f"{day.isoformat()} {total}")
+            day += datetime.timedelta(days=1)
+
+    @transaction.atomic()
+    def rebuild_day(self, day: datetime.date) -> int:
+        start_time = datetime.datetime.combine(day, datetime.time.min, tzinfo=timezone.get_current_timezone())
+        end_time = start_time + datetime.timedelta(days=1)
+        usages = (
+            ChatLog.objects.filter(
+                is_charged=True,
+                created_at__gte=int(start_time.timestamp() * 1000),
+                created_at__lt=int(end_time.timestamp() * 1000),
+            )
+            .values("user_id", "model")
+            .annotate(
+                prompt_tokens_sum=Sum("prompt_tokens"),
+                completion_tokens_sum=Sum("completion_tokens"),
+                vision_count_sum=Sum("vision_count"),
+                request_count=Count("id"),
+                # unit price is per 1k, divide after summing
+                cost_sum=Sum(
+                    F("prompt_tokens") * F("prompt_token_unit_price")
+                    + F("completion_tokens") * F("completion_token_unit_price")
+                    + F("vision_count") * F("vision_unit_price")
+                    + F("request_unit_price"),
+                    output_field=DecimalField(max_digits=PRICE_DIGIT_NUMS, decimal_places=PRICE_DECIMAL_NUMS),
+                ),
+            )
+        )
+        ChatUsageRollup.objects.filter(day=day).delete()
+        rollups = ChatUsageRollup.objects.bulk_create(
+            [
+                ChatUsageRollup(
+                    user_id=usage["user_id"],
+                    model=usage["model"] or "",
+                    day=day,
+                    prompt_tokens=usage["prompt_tokens_sum"],
+                    completion_tokens=usage["completion_tokens_sum"],
+                    vision_count=usage["vision_count_sum"],
+                    request_count=usage["request_count"],
+                    cost=(usage["cost_sum"] or Decimal(0)) / 1000,
+                )
+                for usage in usages
+            ]
+        )
+        return len(rollups)
@@ -0,0 +1,19 @@
+# pylint: disable=R0801,C0103
+# Generated by Django 4.2.30 on 2026-10-17 13:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0029_remove_aimodel_is_vision_alter_aimodel_provider"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatlog",
+            name="is_cached",
+            field=models.BooleanField(default=False, verbose_name="Is Cached"),
+        ),
+    ]
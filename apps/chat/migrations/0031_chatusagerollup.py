@@ -0,0 +1,72 @@
+# pylint: disable=R0801,C0103
+# Generated by Django 4.2.30 on 2026-10-17 13:20
+
+import django.db.models.deletion
+import ovinc_client.core.models
+import ovinc_client.core.utils
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("chat", "0030_chatlog_is_cached"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChatUsageRollup",
+            fields=[
+                (
+                    "id",
+                    ovinc_client.core.models.UniqIDField(
+                        default=ovinc_client.core.utils.uniq_id_without_time,
+                        max_length=32,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("model", models.CharField(max_length=64, verbose_name="Model")),
+                ("day", models.DateField(verbose_name="Day")),
+                (
+                    "prompt_tokens",
+                    models.BigIntegerField(default=int, verbose_name="Prompt Tokens"),
+                ),
+                (
+                    "completion_tokens",
+                    models.BigIntegerField(default=int, verbose_name="Completion Tokens"),
+                ),
+                (
+                    "vision_count",
+                    models.BigIntegerField(default=int, verbose_name="Vision Count"),
+                ),
+                (
+                    "request_count",
+                    models.BigIntegerField(default=int, verbose_name="Request Count"),
+                ),
+                (
+                    "cost",
+                    models.DecimalField(decimal_places=10, default=0, max_digits=20, verbose_name="Cost"),
+                ),
+                (
+                    "user",
+                    ovinc_client.core.models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.PROTECT,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="User",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Chat Usage Rollup",
+                "verbose_name_plural": "Chat Usage Rollup",
+                "ordering": ["-day", "user", "model"],
+                "unique_together": {("user", "model", "day")},
+                "index_together": {("day", "model")},
+            },
+        ),
+    ]
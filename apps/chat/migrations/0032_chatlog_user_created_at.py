@@ -0,0 +1,24 @@
+# pylint: disable=R0801,C0103
+# Generated by Django 4.2.30 on 2026-10-17 13:24
+
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("chat", "0031_chatusagerollup"),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name="chatlog",
+            index_together={
+                ("finished_at", "is_charged"),
+                ("user", "finished_at", "created_at"),
+                ("user", "created_at"),
+            },
+        ),
+    ]
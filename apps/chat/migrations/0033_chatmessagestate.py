@@ -0,0 +1,67 @@
+# pylint: disable=R0801,C0103
+# Generated by Django 4.2.30 on 2026-10-17 13:25
+
+import django.db.models.deletion
+import ovinc_client.core.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("chat", "0032_chatlog_user_created_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChatMessageState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(primary_key=True, serialize=False, verbose_name="ID"),
+                ),
+                (
+                    "message_id",
+                    models.CharField(max_length=64, verbose_name="Message ID"),
+                ),
+                (
+                    "action",
+                    models.SmallIntegerField(choices=[(1, "Update"), (2, "Delete")], verbose_name="Action"),
+                ),
+                (
+                    "content",
+                    models.TextField(
+                        blank=True,
+                        help_text="Encrypted Message Content",
+                        verbose_name="Content",
+                    ),
+                ),
+                ("change_log_id", models.BigIntegerField(verbose_name="Change Log ID")),
+                ("updated_at", models.DateTimeField(verbose_name="Update Time")),
+                (
+                    "user",
+                    ovinc_client.core.models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.PROTECT,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="User",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Chat Message State",
+                "verbose_name_plural": "Chat Message State",
+                "ordering": ["updated_at", "id"],
+                "indexes": [
+                    models.Index(
+                        fields=["user", "updated_at"],
+                        name="chat_chatme_user_id_4b9324_idx",
+                    ),
+                    models.Index(fields=["updated_at"], name="chat_chatme_updated_10e554_idx"),
+                ],
+                "unique_together": {("user", "message_id")},
+            },
+        ),
+    ]
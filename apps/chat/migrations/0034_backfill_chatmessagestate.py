@@ -0,0 +1,43 @@
+# pylint: disable=R0801,C0103
+
+from django.db import migrations
+from django.db.models import Max
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def backfill_message_state(apps, *args, **kwargs) -> None:
+    ChatMessageChangeLog = apps.get_model("chat", "ChatMessageChangeLog")
+    ChatMessageState = apps.get_model("chat", "ChatMessageState")
+    latest_ids = list(
+        ChatMessageChangeLog.objects.values("user_id", "message_id")
+        .annotate(latest_id=Max("id"))
+        .order_by()
+        .values_list("latest_id", flat=True)
+    )
+    latest_ids.sort()
+    for index in range(0, len(latest_ids), BACKFILL_BATCH_SIZE):
+        logs = ChatMessageChangeLog.objects.filter(id__in=latest_ids[index : index + BACKFILL_BATCH_SIZE])
+        ChatMessageState.objects.bulk_create(
+            [
+                ChatMessageState(
+                    user_id=log.user_id,
+                    message_id=log.message_id,
+                    action=log.action,
+                    content=log.content,
+                    change_log_id=log.id,
+                    updated_at=log.created_at,
+                )
+                for log in logs
+            ]
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0033_chatmessagestate"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_message_state, migrations.RunPython.noop),
+    ]
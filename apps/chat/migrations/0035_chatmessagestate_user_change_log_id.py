@@ -0,0 +1,18 @@
+# pylint: disable=R0801,C0103
+# Generated by Django 4.2.30 on 2026-10-17 13:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0034_backfill_chatmessagestate"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="chatmessagestate",
+            index=models.Index(fields=["user", "change_log_id"], name="chat_chatme_user_id_f9383e_idx"),
+        ),
+    ]
@@ -1,10 +1,11 @@
 # pylint: disable=C0103
 
 from decimal import Decimal
+from hashlib import sha256
 from typing import List
 
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import connection, models
 from django.db.models import Index, Q, QuerySet
 from django.utils.translation import gettext_lazy
 from ovinc_client.core.constants import MAX_CHAR_LENGTH, MEDIUM_CHAR_LENGTH
@@ -88,6 +89,18 @@ class OpenRouterModelInfo(BaseDataModel):
     pricing: OpenRouterModelPrice
 
 
+class UpstreamEndpoint(BaseDataModel):
+    base_url: str | None = None
+    api_key: str | None = None
+    proxy: str | None = None
+    api_model: str | None = None
+    weight: float = 1
+
+    @property
+    def key(self) -> str:
+        return sha256(f"{self.base_url}:{self.api_key}:{self.proxy}".encode()).hexdigest()[:16]
+
+
 class ChatLog(BaseModel):
     """
     Chat Log
@@ -135,6 +148,7 @@ class ChatLog(BaseModel):
     created_at = models.BigIntegerField(gettext_lazy("Create Time"), db_index=True)
     finished_at = models.BigIntegerField(gettext_lazy("Finish Time"), db_index=True, null=True, blank=True)
     is_charged = models.BooleanField(gettext_lazy("Is Charged"), default=False, db_index=True)
+    is_cached = models.BooleanField(gettext_lazy("Is Cached"), default=False)
 
     class Meta:
         verbose_name = gettext_lazy("Chat Log")
@@ -143,9 +157,35 @@ class ChatLog(BaseModel):
         index_together = [
             ["finished_at", "is_charged"],
             ["user", "finished_at", "created_at"],
+            ["user", "created_at"],
         ]
 
 
+class ChatUsageRollup(BaseModel):
+    """
+    Daily usage of each user and model
+    """
+
+    id = UniqIDField(gettext_lazy("ID"), primary_key=True)
+    user = ForeignKey(gettext_lazy("User"), to="account.User", on_delete=models.PROTECT)
+    model = models.CharField(gettext_lazy("Model"), max_length=MEDIUM_CHAR_LENGTH)
+    day = models.DateField(gettext_lazy("Day"))
+    prompt_tokens = models.BigIntegerField(gettext_lazy("Prompt Tokens"), default=int)
+    completion_tokens = models.BigIntegerField(gettext_lazy("Completion Tokens"), default=int)
+    vision_count = models.BigIntegerField(gettext_lazy("Vision Count"), default=int)
+    request_count = models.BigIntegerField(gettext_lazy("Request Count"), default=int)
+    cost = models.DecimalField(
+        gettext_lazy("Cost"), max_digits=PRICE_DIGIT_NUMS, decimal_places=PRICE_DECIMAL_NUMS, default=0
+    )
+
+    class Meta:
+        verbose_name = gettext_lazy("Chat Usage Rollup")
+        verbose_name_plural = verbose_name
+        ordering = ["-day", "user", "model"]
+        unique_together = [["user", "model", "day"]]
+        index_together = [["day", "model"]]
+
+
 class AIModel(BaseModel):
     """
     AI Model
@@ -195,9 +235,10 @@ class AIModel(BaseModel):
 
     @classmethod
     def check_user_permission(cls, user: USER_MODEL, model: str) -> bool:
-        if not model:
-            return False
-        return cls.list_user_models(user).filter(model=model).exists()
+        # pylint: disable=C0415
+        from apps.chat.registry import model_entitlements
+
+        return model_entitlements.check_user_permission(user, model=model)
 
 
 class ModelPermission(BaseModel):
@@ -265,3 +306,72 @@ class ChatMessageChangeLog(BaseModel):
 
     def __str__(self) -> str:
         return f"{self.user}:{self.message_id}"
+
+
+class ChatMessageState(BaseModel):
+    """
+    Chat Message State
+    latest change of each message, projected from change log
+    """
+
+    id = models.BigAutoField(gettext_lazy("ID"), primary_key=True)
+    user = ForeignKey(gettext_lazy("User"), to="account.User", on_delete=models.PROTECT)
+    message_id = models.CharField(gettext_lazy("Message ID"), max_length=MEDIUM_CHAR_LENGTH)
+    action = models.SmallIntegerField(gettext_lazy("Action"), choices=MessageSyncAction.choices)
+    content = models.TextField(gettext_lazy("Content"), help_text=gettext_lazy("Encrypted Message Content"), blank=True)
+    change_log_id = models.BigIntegerField(gettext_lazy("Change Log ID"))
+    updated_at = models.DateTimeField(gettext_lazy("Update Time"))
+
+    class Meta:
+        verbose_name = gettext_lazy("Chat Message State")
+        verbose_name_plural = verbose_name
+        ordering = ["updated_at", "id"]
+        unique_together = [["user", "message_id"]]
+        indexes = [
+            Index(fields=["user", "updated_at"]),
+            Index(fields=["user", "change_log_id"]),
+            Index(fields=["updated_at"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.user}:{self.message_id}"
+
+    @classmethod
+    def upsert(cls, logs: List[ChatMessageChangeLog]) -> None:
+        """
+        upsert latest state of messages in one statement, only newer change log overwrites
+        """
+
+        latest_logs = {}
+        for log in sorted(logs, key=lambda log: log.id):
+            latest_logs[(log.user_id, log.message_id)] = log
+        if not latest_logs:
+            return
+
+        # logs of concurrent requests may commit out of id order, keep state of the newer one
+        quote_name = connection.ops.quote_name
+        table = quote_name(cls._meta.db_table)
+        fields = [cls._meta.get_field(name) for name in ["user", "message_id", "action", "content", "updated_at"]]
+        fields.append(cls._meta.get_field("change_log_id"))
+        columns = [quote_name(field.column) for field in fields]
+        change_log_id = quote_name(cls._meta.get_field("change_log_id").column)
+        params = []
+        for log in latest_logs.values():
+            values = [log.user_id, log.message_id, log.action, log.content, log.created_at, log.id]
+            params.extend(field.get_db_prep_save(value, connection) for field, value in zip(fields, values))
+        placeholders = ", ".join([f"({', '.join(['%s'] * len(fields))})"] * len(latest_logs))
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES {placeholders} "
+        if connection.vendor == "mysql":
+            # assignments are applied in order, change log id has to be the last one
+            sql += "ON DUPLICATE KEY UPDATE " + ", ".join(
+                f"{column} = IF(VALUES({change_log_id}) > {change_log_id}, VALUES({column}), {column})"
+                for column in columns[2:]
+            )
+        else:
+            sql += (
+                f"ON CONFLICT ({columns[0]}, {columns[1]}) DO UPDATE SET "
+                + ", ".join(f"{column} = excluded.{column}" for column in columns[2:])
+                + f" WHERE excluded.{change_log_id} > {table}.{change_log_id}"
+            )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
@@ -4,6 +4,7 @@ from apps.chat.exceptions import NoModelPermission
 from apps.chat.models import AIModel
 from apps.wallet.exceptions import NoBalanceException
 from apps.wallet.models import Wallet
+from apps.wallet.utils import wallet_hold
 
 
 class AIModelPermission(BasePermission):
@@ -23,6 +24,8 @@ class AIModelPermission(BasePermission):
 
     def load_balance(self, request) -> float:
         try:
-            return Wallet.objects.get(user=request.user).balance
+            balance = Wallet.objects.get(user=request.user).balance
         except Wallet.DoesNotExist:  # pylint: disable=E1101
             return 0
+        # exclude balance held by running chats
+        return balance - wallet_hold.load_held(user_id=request.user.pk)
@@ -0,0 +1,156 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404
+from ovinc_client.core.logger import logger
+
+from apps.chat.constants import (
+    AI_MODEL_VERSION_KEY,
+    MODEL_PERMISSION_VERSION_KEY,
+    USER_MODEL_GRANTS_KEY,
+)
+from apps.chat.models import AIModel, ModelPermission
+
+
+def load_version(key: str) -> int | None:
+    """
+    load version, seed it when missing so that an unset key is not read as a change, None when redis failed
+    """
+
+    try:
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, 0, timeout=None)
+            version = cache.get(key)
+        return version
+    except Exception as err:  # pylint: disable=W0718
+        logger.warning("[LoadVersionFailed] %s %s", key, err)
+        return None
+
+
+class ModelRegistry:
+    """
+    In-process read-through registry of ai models
+    reloaded when the version key in redis is bumped by any worker
+    """
+
+    def __init__(self) -> None:
+        self._models: dict[str, AIModel] = {}
+        self._version: int | None = None
+        self._loaded = False
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def get(self, model: str) -> AIModel | None:
+        return self.load().get(model)
+
+    def get_model(self, model: str, is_enabled: bool = True) -> AIModel:
+        model_inst = self.get(model)
+        if model_inst is None or (is_enabled and not model_inst.is_enabled):
+            raise Http404()
+        return model_inst
+
+    def all(self) -> list[AIModel]:
+        return list(self.load().values())
+
+    def load(self) -> dict[str, AIModel]:
+        # check version at most once per interval, models are reloaded only when version changed
+        if time.monotonic() - self._checked_at < settings.AI_MODEL_REGISTRY_CHECK_INTERVAL:
+            return self._models
+        with self._lock:
+            if time.monotonic() - self._checked_at < settings.AI_MODEL_REGISTRY_CHECK_INTERVAL:
+                return self._models
+            # version unknown when redis failed, keep loaded models until it is back
+            version = load_version(AI_MODEL_VERSION_KEY)
+            if not self._loaded or (version is not None and version != self._version):
+                self._models = {model.model: model for model in AIModel.objects.all()}
+                self._version = version
+                self._loaded = True
+                logger.info("[ModelRegistryReloaded] Version: %s; Total: %d", version, len(self._models))
+            self._checked_at = time.monotonic()
+            return self._models
+
+    def invalidate(self) -> None:
+        """
+        bump version to notify all workers, and drop local copy at once
+        """
+
+        try:
+            cache.add(AI_MODEL_VERSION_KEY, 0, timeout=None)
+            cache.incr(AI_MODEL_VERSION_KEY)
+        except Exception as err:  # pylint: disable=W0718
+            logger.warning("[InvalidateModelRegistryFailed] %s", err)
+        self._loaded = False
+        self._checked_at = 0
+
+
+model_registry = ModelRegistry()
+
+
+class ModelEntitlements:
+    """
+    Per-user allowed model sets
+    granted model ids are cached in redis and in process under a global version, which is bumped on permission changes,
+    is_public and is_enabled are read from model registry, so model changes take effect through its own version
+    """
+
+    def __init__(self) -> None:
+        self._grants: dict[str, set[str]] = {}
+        self._version: int | None = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def list_user_models(self, user) -> list[AIModel]:
+        grants = self.load_grants(user)
+        return [model for model in model_registry.all() if model.is_enabled and (model.is_public or model.pk in grants)]
+
+    def list_user_model_names(self, user) -> set[str]:
+        return {model.model for model in self.list_user_models(user)}
+
+    def check_user_permission(self, user, model: str) -> bool:
+        if not model:
+            return False
+        return model in self.list_user_model_names(user)
+
+    def load_grants(self, user) -> set[str]:
+        self.check_version()
+        grants = self._grants.get(user.pk)
+        if grants is not None:
+            return grants
+        cache_key = USER_MODEL_GRANTS_KEY.format(version=self._version, user_id=user.pk)
+        grants = cache.get(cache_key)
+        if grants is None:
+            grants = set(
+                ModelPermission.objects.filter(user=user, models__isnull=False).values_list("models", flat=True)
+            )
+            cache.set(cache_key, grants, timeout=settings.USER_MODEL_GRANTS_TIMEOUT)
+        if len(self._grants) >= settings.USER_MODEL_GRANTS_LOCAL_SIZE:
+            self._grants = {}
+        self._grants[user.pk] = grants
+        return grants
+
+    def check_version(self) -> None:
+        # drop local grants when version changed, check at most once per interval
+        if time.monotonic() - self._checked_at < settings.AI_MODEL_REGISTRY_CHECK_INTERVAL:
+            return
+        with self._lock:
+            # version unknown when redis failed, keep local grants until it is back
+            version = load_version(MODEL_PERMISSION_VERSION_KEY)
+            if version is not None and version != self._version:
+                self._grants = {}
+                self._version = version
+            self._checked_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        try:
+            cache.add(MODEL_PERMISSION_VERSION_KEY, 0, timeout=None)
+            cache.incr(MODEL_PERMISSION_VERSION_KEY)
+        except Exception as err:  # pylint: disable=W0718
+            logger.warning("[InvalidateModelEntitlementsFailed] %s", err)
+        self._grants = {}
+        self._checked_at = 0
+
+
+model_entitlements = ModelEntitlements()
@@ -0,0 +1,103 @@
+import datetime
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max, QuerySet
+from django.utils import timezone
+from ovinc_client.core.logger import celery_logger
+
+from apps.chat.constants import RetentionPolicy
+from apps.chat.models import ChatLog, ChatMessageChangeLog, ChatMessageState
+
+
+class RetentionPurger:
+    """
+    Delete expired rows in primary key ordered batches, one batch per call,
+    with progress checkpointed so that the next batch resumes where the last one stopped
+    """
+
+    checkpoint_key_format = "retention:checkpoint:{name}"
+    running_key_format = "retention:running:{name}"
+
+    def __init__(self, name: str, queryset: QuerySet) -> None:
+        self.name = name
+        self.queryset = queryset
+        self.checkpoint_key = self.checkpoint_key_format.format(name=name)
+        self.running_key = self.running_key_format.format(name=name)
+
+    def is_running(self) -> bool:
+        return bool(cache.get(self.running_key))
+
+    def purge_batch(self) -> float | None:
+        """
+        delete one batch, return delay before next batch or None when purge finished
+        """
+
+        checkpoint = cache.get(self.checkpoint_key)
+        if checkpoint is None:
+            # rows expired after purge started are left to next purge, which also bounds the last scan
+            boundary = self.queryset.aggregate(boundary=Max("pk"))["boundary"]
+            if boundary is None:
+                self.finish(total=0)
+                return None
+            checkpoint = {"boundary": boundary, "pk": None, "total": 0}
+        else:
+            celery_logger.info("[RetentionPurgeResume] Name: %s; Checkpoint: %s", self.name, checkpoint["pk"])
+
+        queryset = self.queryset.filter(pk__lte=checkpoint["boundary"])
+        if checkpoint["pk"] is not None:
+            queryset = queryset.filter(pk__gt=checkpoint["pk"])
+        pks = list(queryset.order_by("pk").values_list("pk", flat=True)[: settings.RETENTION_BATCH_SIZE])
+
+        # filter again in case rows changed after selected
+        started_at = time.monotonic()
+        deleted = self.queryset.filter(pk__in=pks).delete()[0] if pks else 0
+        checkpoint["total"] += deleted
+        celery_logger.info(
+            "[RetentionPurgeBatch] Name: %s; Deleted: %d; Total: %d", self.name, deleted, checkpoint["total"]
+        )
+
+        if len(pks) < settings.RETENTION_BATCH_SIZE:
+            self.finish(total=checkpoint["total"])
+            return None
+
+        checkpoint["pk"] = pks[-1]
+        delay = self.get_delay(rows=len(pks), duration=time.monotonic() - started_at)
+        cache.set(self.checkpoint_key, checkpoint, timeout=settings.RETENTION_CHECKPOINT_TIMEOUT)
+        cache.set(self.running_key, True, timeout=delay + settings.RETENTION_RUNNING_TIMEOUT)
+        return delay
+
+    def finish(self, total: int) -> None:
+        cache.delete_many([self.checkpoint_key, self.running_key])
+        celery_logger.info("[RetentionPurgeFinished] Name: %s; Total: %d", self.name, total)
+
+    def get_delay(self, rows: int, duration: float) -> float:
+        delay = settings.RETENTION_BATCH_INTERVAL
+        if settings.RETENTION_MAX_ROWS_PER_SECOND > 0:
+            delay = max(delay, rows / settings.RETENTION_MAX_ROWS_PER_SECOND - duration)
+        return delay
+
+
+def build_retention_purger(policy: str) -> RetentionPurger | None:
+    """
+    build purger of policy with current expiry, None when policy disabled
+    """
+
+    match policy:
+        case RetentionPolicy.CHAT_MESSAGE_STATE:
+            # messages without change in retention are no longer synced
+            expired_at = timezone.now() - datetime.timedelta(days=settings.MESSAGE_LOG_RETAIN_DAYS)
+            queryset = ChatMessageState.objects.filter(updated_at__lt=expired_at)
+        case RetentionPolicy.CHAT_MESSAGE_CHANGE_LOG:
+            expired_at = timezone.now() - datetime.timedelta(days=settings.MESSAGE_LOG_RETAIN_DAYS)
+            queryset = ChatMessageChangeLog.objects.filter(created_at__lt=expired_at)
+        case RetentionPolicy.CHAT_LOG:
+            if settings.CHATLOG_RETAIN_DAYS <= 0:
+                return None
+            # only charged logs, usage is kept in rollup
+            expired_at = timezone.now() - datetime.timedelta(days=settings.CHATLOG_RETAIN_DAYS)
+            queryset = ChatLog.objects.filter(is_charged=True, created_at__lt=int(expired_at.timestamp() * 1000))
+        case _:
+            return None
+    return RetentionPurger(name=policy, queryset=queryset)
@@ -7,7 +7,13 @@ from django.utils.translation import gettext_lazy
 from rest_framework import serializers
 
 from apps.chat.constants import MESSAGE_MIN_LENGTH, MessageSyncAction, OpenAIRole
-from apps.chat.models import ChatLog, ChatMessageChangeLog, SystemPreset
+from apps.chat.models import (
+    ChatLog,
+    ChatMessageChangeLog,
+    ChatMessageState,
+    ChatUsageRollup,
+    SystemPreset,
+)
 
 
 class OpenAIMessageSerializer(serializers.Serializer):
@@ -88,6 +94,48 @@ class ChatLogSerializer(serializers.ModelSerializer):
         return _datetime.strftime("%y/%m/%d %H:%M:%S")
 
 
+class ChatUsageQuerySerializer(serializers.Serializer):
+    """
+    Chat Usage Query
+    """
+
+    start_day = serializers.DateField(label=gettext_lazy("Start Day"), required=False)
+    end_day = serializers.DateField(label=gettext_lazy("End Day"), required=False)
+
+    def validate(self, attrs: dict) -> dict:
+        data = super().validate(attrs)
+        today = timezone.localdate()
+        data.setdefault("end_day", today)
+        data.setdefault("start_day", today - datetime.timedelta(days=settings.CHATLOG_QUERY_DAYS))
+        if data["start_day"] > data["end_day"]:
+            raise serializers.ValidationError(gettext_lazy("Start Day Should Not Be After End Day"))
+        return data
+
+
+class ChatUsageSerializer(serializers.ModelSerializer):
+    """
+    Chat Usage
+    """
+
+    model_name = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ChatUsageRollup
+        fields = [
+            "day",
+            "model",
+            "model_name",
+            "prompt_tokens",
+            "completion_tokens",
+            "vision_count",
+            "request_count",
+            "cost",
+        ]
+
+    def get_model_name(self, obj: ChatUsageRollup) -> str:
+        return self.context.get("model_map", {}).get(obj.model, obj.model)
+
+
 class MessageChangeLogSerializer(serializers.ModelSerializer):
     """
     Message Change Log
@@ -98,6 +146,16 @@ class MessageChangeLogSerializer(serializers.ModelSerializer):
         fields = ["message_id", "action", "content"]
 
 
+class MessageStateSerializer(serializers.ModelSerializer):
+    """
+    Message State
+    """
+
+    class Meta:
+        model = ChatMessageState
+        fields = ["message_id", "action", "content"]
+
+
 class ListMessageChangeLogSerializer(serializers.Serializer):
     """
     List Message Change Log
@@ -112,6 +170,20 @@ class ListMessageChangeLogSerializer(serializers.Serializer):
             raise serializers.ValidationError(gettext_lazy("Invalid Start Time")) from err
 
 
+class SyncMessageStateSerializer(serializers.Serializer):
+    """
+    Sync Message State
+    """
+
+    cursor = serializers.IntegerField(label=gettext_lazy("Cursor"), min_value=0, default=0)
+    size = serializers.IntegerField(
+        label=gettext_lazy("Page Size"),
+        min_value=1,
+        max_value=settings.MESSAGE_SYNC_MAX_PAGE_SIZE,
+        default=settings.MESSAGE_SYNC_PAGE_SIZE,
+    )
+
+
 class CreateMessageChangeLogSerializer(serializers.Serializer):
     """
     Create Message Change Log
@@ -120,3 +192,21 @@ class CreateMessageChangeLogSerializer(serializers.Serializer):
     message_id = serializers.CharField(label=gettext_lazy("Message ID"))
     action = serializers.ChoiceField(label=gettext_lazy("Action"), choices=MessageSyncAction.choices)
     content = serializers.CharField(label=gettext_lazy("Content"), allow_blank=True)
+
+
+class BatchCreateMessageChangeLogSerializer(serializers.Serializer):
+    """
+    Batch Create Message Change Log
+    """
+
+    logs = serializers.ListField(
+        label=gettext_lazy("Message Change Logs"),
+        child=CreateMessageChangeLogSerializer(),
+        min_length=1,
+        max_length=settings.MESSAGE_LOG_BATCH_SIZE,
+    )
+
+    def validate_logs(self, logs: list[dict]) -> list[dict]:
+        if sum(len(log["content"]) for log in logs) > settings.MESSAGE_LOG_BATCH_CONTENT_SIZE:
+            raise serializers.ValidationError(gettext_lazy("Message Content Too Large"))
+        return logs
@@ -0,0 +1,96 @@
+import asyncio
+from contextlib import aclosing
+from typing import AsyncGenerator
+
+from apps.chat.utils import format_response
+
+STREAM_END = object()
+DELTA_KEYS = format_response(log_id="").keys()
+
+
+def is_delta(data: dict) -> bool:
+    return data.keys() == DELTA_KEYS and not data["is_finished"]
+
+
+async def produce_stream(stream: AsyncGenerator, queue: asyncio.Queue) -> None:
+    # pull the whole stream inside one task, so context managers in the generator enter and exit in the same context
+    try:
+        async with aclosing(stream) as _stream:
+            async for data in _stream:
+                queue.put_nowait(data)
+    except Exception as err:  # pylint: disable=W0718
+        queue.put_nowait(err)
+    queue.put_nowait(STREAM_END)
+
+
+async def coalesce_stream(stream: AsyncGenerator, max_delay: float, max_size: int) -> AsyncGenerator:
+    """
+    merge consecutive delta frames until max delay (seconds) or max size (bytes) reached
+    the first delta and any non-delta frame are flushed immediately
+    """
+
+    if max_delay <= 0 or max_size <= 0:
+        async with aclosing(stream) as _stream:
+            async for data in _stream:
+                yield data
+        return
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    producer = asyncio.create_task(produce_stream(stream=stream, queue=queue))
+    buffer: dict | None = None
+    buffer_size = 0
+    deadline = 0
+    is_first = True
+
+    try:
+        while True:
+            # wait for next frame, flush buffer when deadline exceeded
+            try:
+                if buffer is None:
+                    item = await queue.get()
+                else:
+                    item = await asyncio.wait_for(queue.get(), timeout=max(deadline - loop.time(), 0))
+            except asyncio.TimeoutError:
+                yield buffer
+                buffer = None
+                continue
+            # stream finished
+            if item is STREAM_END:
+                break
+            if isinstance(item, Exception):
+                if buffer is not None:
+                    yield buffer
+                    buffer = None
+                raise item
+            # flush buffer before non-delta frames
+            if not is_delta(item):
+                if buffer is not None:
+                    yield buffer
+                    buffer = None
+                yield item
+                continue
+            # first token
+            if is_first:
+                is_first = False
+                yield item
+                continue
+            # merge
+            if buffer is None:
+                buffer = dict(item)
+                buffer_size = 0
+                deadline = loop.time() + max_delay
+            else:
+                buffer["data"] += item["data"]
+                buffer["thinking"] += item["thinking"]
+            buffer_size += len(item["data"].encode()) + len(item["thinking"].encode())
+            if buffer_size >= max_size:
+                yield buffer
+                buffer = None
+        if buffer is not None:
+            yield buffer
+    finally:
+        # closing or cancelling the coalescer aborts the upstream stream
+        if not producer.done():
+            producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
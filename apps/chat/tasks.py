@@ -1,45 +1,33 @@
-import datetime
-
 from django.conf import settings
-from django.db import transaction
-from django.db.models import F
-from django.shortcuts import get_object_or_404
-from django.utils import timezone
 from httpx import Client
 from ovinc_client.core.lock import task_lock
 from ovinc_client.core.logger import celery_logger
 
 from apps.cel import app
-from apps.chat.models import AIModel, ChatLog, ChatMessageChangeLog, OpenRouterModelInfo
-from apps.wallet.models import Wallet
+from apps.chat.billing import billing_queue, charge_logs
+from apps.chat.constants import RetentionPolicy
+from apps.chat.models import AIModel, OpenRouterModelInfo
+from apps.chat.retention import build_retention_purger
 
 
 @app.task(bind=True)
-@transaction.atomic()
 def calculate_usage_limit(self, log_id: str):
     """
     Calculate Model Usage Limit
     """
 
-    log = get_object_or_404(ChatLog, id=log_id)
-    usage = log.prompt_tokens + log.completion_tokens
-    celery_logger.info(
-        "[CalculateUsageLimit] LogID: %s; User: %s; Model: %s; Usage: %d; Vision: %d",
-        log_id,
-        log.user.username,
-        log.model,
-        usage,
-        log.vision_count,
-    )
-
-    ChatLog.objects.filter(id=log.id).update(is_charged=True)
-    Wallet.objects.filter(user=log.user).update(
-        balance=F("balance")
-        - (log.prompt_tokens * log.prompt_token_unit_price / 1000)
-        - (log.completion_tokens * log.completion_token_unit_price / 1000)
-        - (log.vision_count * log.vision_unit_price / 1000)
-        - (log.request_unit_price / 1000)
-    )
+    charge_logs(log_ids=[log_id])
+
+
+@app.task(bind=True)
+def drain_billing_stream(self):
+    """
+    Charge Usage From Billing Stream
+    """
+
+    total = billing_queue.drain(consumer=self.request.hostname or "default")
+    if total:
+        celery_logger.info("[DrainBillingStream] Total: %d", total)
 
 
 @app.task(bind=True)
@@ -98,20 +86,40 @@ def delete_old_history(self):
     Delete Old Message History
     """
 
-    celery_logger.info("[DeleteOldMessageHistory] Start %s", self.request.id)
+    start_retention_purge(RetentionPolicy.CHAT_MESSAGE_STATE)
+    start_retention_purge(RetentionPolicy.CHAT_MESSAGE_CHANGE_LOG)
 
-    logs = ChatMessageChangeLog.objects.filter(
-        created_at__lt=(timezone.now() - datetime.timedelta(days=settings.MESSAGE_LOG_RETAIN_DAYS))
-    ).prefetch_related("user")
-    celery_logger.info("[DeleteOldMessageHistory] Total: %d", logs.count())
-    for log in logs:
-        celery_logger.info(
-            "[DeleteOldMessageHistory] ID: %d; User: %s; MessageID: %s; CreatedAt: %s",
-            log.id,
-            log.user,
-            log.message_id,
-            log.created_at,
-        )
-    logs.delete()
 
-    celery_logger.info("[DeleteOldMessageHistory] End %s", self.request.id)
+@app.task(bind=True)
+@task_lock()
+def delete_old_chat_log(self):
+    """
+    Delete Old Chat Log
+    """
+
+    start_retention_purge(RetentionPolicy.CHAT_LOG)
+
+
+def start_retention_purge(policy: str) -> None:
+    purger = build_retention_purger(policy)
+    if purger is None:
+        return
+    if purger.is_running():
+        celery_logger.info("[RetentionPurgeRunning] Name: %s", policy)
+        return
+    purge_expired_rows.delay(policy)
+
+
+@app.task(bind=True)
+def purge_expired_rows(self, policy: str):
+    """
+    Purge One Batch of Expired Rows
+    next batch is scheduled instead of sleeping, so that other tasks are not blocked
+    """
+
+    purger = build_retention_purger(policy)
+    if purger is None:
+        return
+    delay = purger.purge_batch()
+    if delay is not None:
+        purge_expired_rows.apply_async(args=(policy,), countdown=delay)
@@ -0,0 +1,89 @@
+import asyncio
+from unittest import mock
+
+import httpx
+from django.test import SimpleTestCase, override_settings
+from openai import InternalServerError
+
+from apps.chat.client import OpenAIClient
+from apps.chat.client.router import endpoint_router
+from apps.chat.models import Message, UpstreamEndpoint
+
+
+@override_settings(UPSTREAM_ROUTER_FAILOVER_STATUS_CODES=[503])
+class RequestEndpointsTestCase(SimpleTestCase):
+    """
+    Failover and hedging across upstream endpoints
+    """
+
+    def setUp(self) -> None:
+        self.primary = UpstreamEndpoint(base_url="http://a/v1", api_key="a")
+        self.alternate = UpstreamEndpoint(base_url="http://b/v1", api_key="b")
+        self.requested = []
+        self.client = OpenAIClient.__new__(OpenAIClient)
+        self.client.model = "model"
+        self.client.report_metric = mock.AsyncMock()
+        self.client.request_endpoint = self.request_endpoint
+        for patcher in [
+            mock.patch.object(OpenAIClient, "endpoints", new_callable=mock.PropertyMock, return_value=[]),
+            mock.patch.object(endpoint_router, "select", mock.AsyncMock(return_value=[self.primary, self.alternate])),
+            mock.patch.object(endpoint_router, "report_success", mock.AsyncMock()),
+            mock.patch.object(endpoint_router, "report_failure", mock.AsyncMock()),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def request_endpoint(self, endpoint: UpstreamEndpoint):
+        self.requested.append(endpoint.base_url)
+        if endpoint is self.primary:
+            await asyncio.sleep(self.primary_delay)
+            request = httpx.Request("POST", endpoint.base_url)
+            raise InternalServerError("unavailable", response=httpx.Response(503, request=request), body=None)
+        return endpoint.base_url
+
+    async def test_failover_without_hedge(self):
+        self.primary_delay = 0
+        response = await self.client.request_endpoints(hedge_delay=None)
+        self.assertEqual(response, self.alternate.base_url)
+        self.assertEqual(self.requested, [self.primary.base_url, self.alternate.base_url])
+
+    async def test_failover_when_primary_fails_before_hedge(self):
+        self.primary_delay = 0
+        response = await self.client.request_endpoints(hedge_delay=1)
+        self.assertEqual(response, self.alternate.base_url)
+        self.assertEqual(self.requested, [self.primary.base_url, self.alternate.base_url])
+
+    async def test_hedged_alternate_not_requested_again(self):
+        self.primary_delay = 0.2
+        response = await self.client.request_endpoints(hedge_delay=0.01)
+        self.assertEqual(response, self.alternate.base_url)
+        self.assertEqual(self.requested, [self.primary.base_url, self.alternate.base_url])
+
+
+class ResponseCacheKeyTestCase(SimpleTestCase):
+    """
+    Response cache key covers everything sent upstream
+    """
+
+    def setUp(self) -> None:
+        self.client = OpenAIClient.__new__(OpenAIClient)
+        self.client.model = "model"
+        self.client.messages = [Message(role="user", content="hello")]
+
+    def build_key(self, **model_settings) -> str | None:
+        self.client.model_settings = {"response_cache_enabled": True, "base_url": "http://a/v1", **model_settings}
+        return self.client.build_response_cache_key()
+
+    def test_endpoints_with_different_models_not_cacheable(self):
+        endpoints = [{"base_url": "http://a/v1"}, {"base_url": "http://b/v1", "api_model": "other"}]
+        self.assertIsNone(self.build_key(endpoints=endpoints))
+
+    def test_endpoints_with_same_model_share_key(self):
+        endpoints = [{"base_url": "http://a/v1"}, {"base_url": "http://b/v1", "api_model": "model"}]
+        self.assertEqual(self.build_key(endpoints=endpoints), self.build_key())
+
+    def test_request_params_in_key(self):
+        key = self.build_key()
+        self.assertNotEqual(self.build_key(api_model="other"), key)
+        self.assertNotEqual(self.build_key(extra_query={"version": "1"}), key)
+        self.assertNotEqual(self.build_key(extra_headers={"X-Version": "1"}), key)
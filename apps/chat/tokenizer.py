@@ -0,0 +1,87 @@
+import abc
+from functools import lru_cache
+
+from django.conf import settings
+from ovinc_client.core.logger import logger
+
+from apps.chat.constants import MessageContentType
+from apps.chat.models import Message
+from apps.chat.utils import estimate_tokens
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# per message overhead of chat format
+MESSAGE_EXTRA_TOKENS = 4
+
+
+class BaseTokenizer(abc.ABC):
+    """
+    Base Tokenizer
+    """
+
+    @abc.abstractmethod
+    def count(self, content: str) -> int:
+        raise NotImplementedError()
+
+    def count_message(self, message: Message) -> int:
+        if not isinstance(message.content, list):
+            return self.count(message.content) + MESSAGE_EXTRA_TOKENS
+        tokens = MESSAGE_EXTRA_TOKENS
+        for content in message.content:
+            if content.type == MessageContentType.TEXT:
+                tokens += self.count(content.text)
+            elif content.type == MessageContentType.IMAGE_URL:
+                tokens += settings.CONTEXT_IMAGE_TOKENS
+        return tokens
+
+    def count_messages(self, messages: list[Message]) -> int:
+        return sum(self.count_message(message) for message in messages)
+
+
+class HeuristicTokenizer(BaseTokenizer):
+    """
+    Offline estimation by chars
+    """
+
+    def count(self, content: str) -> int:
+        return estimate_tokens(content)
+
+
+class TiktokenTokenizer(BaseTokenizer):
+    """
+    Tiktoken BPE encoding
+    """
+
+    def __init__(self, encoding: str = "") -> None:
+        if tiktoken is None:
+            raise ImportError("tiktoken not installed")
+        self.encoding = tiktoken.get_encoding(encoding or settings.CONTEXT_TIKTOKEN_ENCODING)
+
+    def count(self, content: str) -> int:
+        if not content:
+            return 0
+        return len(self.encoding.encode(content, disallowed_special=()))
+
+
+TOKENIZERS: dict[str, type[BaseTokenizer]] = {
+    "heuristic": HeuristicTokenizer,
+    "tiktoken": TiktokenTokenizer,
+}
+
+
+@lru_cache
+def get_tokenizer(name: str = "") -> BaseTokenizer:
+    """
+    load tokenizer by "name" or "name:encoding", fall back to heuristic when unavailable (e.g. offline)
+    """
+
+    name, _, encoding = (name or settings.CONTEXT_TOKENIZER).partition(":")
+    try:
+        tokenizer_class = TOKENIZERS[name]
+        return tokenizer_class(encoding) if encoding else tokenizer_class()
+    except Exception as err:  # pylint: disable=W0718
+        logger.warning("[LoadTokenizerFailed] %s %s", name, err)
+        return HeuristicTokenizer()
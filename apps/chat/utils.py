@@ -1,9 +1,14 @@
+import math
+
 from django.utils.translation import gettext
 from opentelemetry import trace
 from opentelemetry.trace import format_trace_id
 
 JSON_DEFAULT_INDENT = 4
 
+# roughly 4 latin chars per token, while most cjk chars take one token each
+ESTIMATE_CHARS_PER_TOKEN = 4
+
 
 def get_current_trace_id() -> str | None:
     try:
@@ -27,3 +32,14 @@ def format_error(log_id: str, error: Exception) -> dict:
 
 def format_response(log_id: str, data: str = "", thinking: str = "") -> dict:
     return {"data": data, "thinking": thinking, "is_finished": False, "log_id": log_id}
+
+
+def format_queue(log_id: str, position: int) -> dict:
+    return {"data": "", "thinking": "", "is_finished": False, "log_id": log_id, "queue_position": position}
+
+
+def estimate_tokens(content: str) -> int:
+    if not content:
+        return 0
+    wide_chars = sum(1 for char in content if ord(char) > 0x2E7F)
+    return wide_chars + math.ceil((len(content) - wide_chars) / ESTIMATE_CHARS_PER_TOKEN)
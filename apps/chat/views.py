@@ -2,11 +2,10 @@ import datetime
 
 from django.conf import settings
 from django.core.cache import cache
-from django.db.models import OuterRef, Q, Subquery
-from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.db.models import Max, Q
 from django.utils import timezone
 from ovinc_client.core.auth import SessionAuthenticate
-from ovinc_client.core.paginations import NumPagination
 from ovinc_client.core.utils import uniq_id
 from ovinc_client.core.viewsets import CreateMixin, ListMixin, MainViewSet
 from rest_framework.decorators import action
@@ -18,21 +17,29 @@ from apps.chat.models import (
     AIModel,
     ChatLog,
     ChatMessageChangeLog,
+    ChatMessageState,
     ChatRequest,
+    ChatUsageRollup,
     MessageContent,
     MessageContentImageUrl,
     SystemPreset,
 )
 from apps.chat.permissions import AIModelPermission
+from apps.chat.registry import model_entitlements, model_registry
 from apps.chat.serializers import (
+    BatchCreateMessageChangeLogSerializer,
     ChatLogSerializer,
+    ChatUsageQuerySerializer,
+    ChatUsageSerializer,
     CreateMessageChangeLogSerializer,
     ListMessageChangeLogSerializer,
-    MessageChangeLogSerializer,
+    MessageStateSerializer,
     OpenAIRequestSerializer,
+    SyncMessageStateSerializer,
     SystemPresetSerializer,
 )
 from apps.cos.utils import TCloudUrlParser
+from core.paginations import KeysetPagination
 
 
 # pylint: disable=R0901
@@ -55,7 +62,7 @@ class ChatViewSet(MainViewSet):
         request_data = ChatRequest(user=request.user.username, **request_serializer.validated_data)
 
         # check model
-        model: AIModel = get_object_or_404(AIModel, model=request_data.model, is_enabled=True)
+        model: AIModel = model_registry.get_model(request_data.model)
 
         # format message
         for message in request_data.messages:
@@ -98,14 +105,33 @@ class ChatViewSet(MainViewSet):
             .order_by("-created_at")
         )
 
-        page = NumPagination()
+        page = KeysetPagination(ordering=("-created_at", "-id"))
         paged_queryset = page.paginate_queryset(queryset=queryset, request=request, view=self)
 
-        model_map = {model.model: model.name for model in AIModel.objects.all()}
+        model_map = {model.model: model.name for model in model_registry.all()}
         serializer = ChatLogSerializer(instance=paged_queryset, many=True, context={"model_map": model_map})
 
         return page.get_paginated_response(data=serializer.data)
 
+    @action(methods=["GET"], detail=False)
+    def usage(self, request, *args, **kwargs):
+        """
+        daily usage from rollup
+        """
+
+        req_slz = ChatUsageQuerySerializer(data=request.query_params)
+        req_slz.is_valid(raise_exception=True)
+        req_data = req_slz.validated_data
+
+        queryset = ChatUsageRollup.objects.filter(
+            user=request.user, day__gte=req_data["start_day"], day__lte=req_data["end_day"]
+        ).order_by("-day", "model")
+
+        model_map = {model.model: model.name for model in model_registry.all()}
+        serializer = ChatUsageSerializer(instance=queryset, many=True, context={"model_map": model_map})
+
+        return Response(data=serializer.data)
+
 
 # pylint: disable=R0901
 class AIModelViewSet(ListMixin, MainViewSet):
@@ -133,7 +159,7 @@ class AIModelViewSet(ListMixin, MainViewSet):
                     "support_vision": model.support_vision,
                 },
             }
-            for model in AIModel.list_user_models(request.user)
+            for model in model_entitlements.list_user_models(request.user)
         ]
         data.sort(key=lambda model: model["name"])
         return Response(data=data)
@@ -173,23 +199,54 @@ class ChatMessageChangeLogView(ListMixin, CreateMixin, MainViewSet):
         req_data = req_slz.validated_data
 
         # load data
-        logs = ChatMessageChangeLog.objects.filter(
-            user=request.user,
-            created_at=Subquery(
-                ChatMessageChangeLog.objects.filter(message_id=OuterRef("message_id"), user=request.user)
-                .order_by("-created_at")
-                .values("created_at")[:1]
-            ),
-        ).order_by("created_at")
+        states = ChatMessageState.objects.filter(user=request.user).order_by("updated_at", "id")
         if req_data.get("start_time"):
-            logs = logs.filter(created_at__gt=req_data["start_time"])
+            states = states.filter(updated_at__gt=req_data["start_time"])
 
         # page
-        queryset = self.paginate_queryset(logs)
+        paginator = KeysetPagination(ordering=("updated_at", "id"))
+        queryset = paginator.paginate_queryset(queryset=states, request=request, view=self)
+
+        # response
+        resp_slz = MessageStateSerializer(instance=queryset, many=True)
+        return paginator.get_paginated_response(resp_slz.data)
+
+    @action(methods=["GET"], detail=False)
+    def sync(self, request: Request, *args, **kwargs) -> Response:
+        """
+        load latest state of messages changed after cursor
+        """
+
+        # validate
+        req_slz = SyncMessageStateSerializer(data=request.query_params)
+        req_slz.is_valid(raise_exception=True)
+        req_data = req_slz.validated_data
+
+        # load data
+        states = ChatMessageState.objects.filter(user=request.user, change_log_id__gt=req_data["cursor"]).order_by(
+            "change_log_id"
+        )[: req_data["size"] + 1]
+
+        # stop before unsettled changes, ids of which may commit out of order
+        settled_at = timezone.now() - datetime.timedelta(seconds=settings.MESSAGE_SYNC_SETTLE_SECONDS)
+        results = []
+        has_more = False
+        for state in states:
+            if state.updated_at > settled_at:
+                break
+            if len(results) >= req_data["size"]:
+                has_more = True
+                break
+            results.append(state)
 
         # response
-        resp_slz = MessageChangeLogSerializer(instance=queryset, many=True)
-        return self.get_paginated_response(resp_slz.data)
+        return Response(
+            data={
+                "cursor": results[-1].change_log_id if results else req_data["cursor"],
+                "has_more": has_more,
+                "results": MessageStateSerializer(instance=results, many=True).data,
+            }
+        )
 
     def create(self, request: Request, *args, **kwargs) -> Response:
         """
@@ -202,12 +259,53 @@ class ChatMessageChangeLogView(ListMixin, CreateMixin, MainViewSet):
         req_data = req_slz.validated_data
 
         # save to db
-        ChatMessageChangeLog.objects.create(
-            user=request.user,
-            message_id=req_data["message_id"],
-            action=req_data["action"],
-            content=req_data["content"],
-        )
+        with transaction.atomic():
+            log = ChatMessageChangeLog.objects.create(
+                user=request.user,
+                message_id=req_data["message_id"],
+                action=req_data["action"],
+                content=req_data["content"],
+            )
+            ChatMessageState.upsert([log])
+
+        # response
+        return Response()
+
+    @action(methods=["POST"], detail=False)
+    def batch(self, request: Request, *args, **kwargs) -> Response:
+        """
+        save messages in batch
+        """
+
+        # validate request
+        req_slz = BatchCreateMessageChangeLogSerializer(data=request.data)
+        req_slz.is_valid(raise_exception=True)
+        req_data = req_slz.validated_data
+
+        # save to db
+        with transaction.atomic():
+            logs = ChatMessageChangeLog.objects.bulk_create(
+                [
+                    ChatMessageChangeLog(
+                        user=request.user,
+                        message_id=log["message_id"],
+                        action=log["action"],
+                        content=log["content"],
+                    )
+                    for log in req_data["logs"]
+                ]
+            )
+            # mysql does not return auto ids from bulk insert, load latest logs of these messages
+            if any(log.id is None for log in logs):
+                logs = ChatMessageChangeLog.objects.filter(
+                    id__in=ChatMessageChangeLog.objects.filter(
+                        user=request.user, message_id__in={log.message_id for log in logs}
+                    )
+                    .values("message_id")
+                    .annotate(latest_id=Max("id"))
+                    .values("latest_id")
+                )
+            ChatMessageState.upsert(list(logs))
 
         # response
         return Response()
@@ -39,6 +39,17 @@ class TCloudUrlParser:
     def url(self) -> str:
         return str(urlunparse(self._parsed_url))
 
+    @classmethod
+    def get_object_key(cls, url: str) -> str | None:
+        """
+        normalized cos object path, ignoring signature and processing params
+        """
+
+        parsed_url = urlparse(url)
+        if not parsed_url.hostname or parsed_url.hostname != cls.cos_url.hostname:
+            return None
+        return unquote(parsed_url.path)
+
     def parse_url(self) -> ParseResult:
         parsed_url = urlparse(self._url)
         if parsed_url.path == unquote(parsed_url.path):
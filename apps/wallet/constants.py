@@ -0,0 +1 @@
+WALLET_HOLD_KEY = "wallet:hold:{}"
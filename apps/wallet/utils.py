@@ -0,0 +1,74 @@
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django_redis.client import DefaultClient
+from ovinc_client.core.logger import logger
+from redis import Redis
+
+from apps.wallet.constants import WALLET_HOLD_KEY
+
+cache: DefaultClient
+
+# place hold only when balance minus unexpired holds covers it, holds are stored as "amount:expire_at"
+HOLD_SCRIPT = """
+local now = tonumber(ARGV[4])
+local held = 0
+local items = redis.call("HGETALL", KEYS[1])
+for index = 1, #items, 2 do
+    local amount, expire_at = string.match(items[index + 1], "^(.-):(.-)$")
+    if tonumber(expire_at) < now then
+        redis.call("HDEL", KEYS[1], items[index])
+    else
+        held = held + tonumber(amount)
+    end
+end
+if tonumber(ARGV[3]) - held < tonumber(ARGV[2]) then
+    return 0
+end
+redis.call("HSET", KEYS[1], ARGV[1], ARGV[2] .. ":" .. (now + tonumber(ARGV[5])))
+redis.call("EXPIRE", KEYS[1], tonumber(ARGV[5]))
+return 1
+"""
+
+
+class WalletHold:
+    """
+    Balance hold for running chats, so concurrent chats cannot overdraw the wallet
+    """
+
+    def __init__(self) -> None:
+        self.redis: Redis = cache.client.get_client()
+        self.hold_script = self.redis.register_script(HOLD_SCRIPT)
+
+    def hold(self, user_id: str, hold_id: str, amount: Decimal, balance: Decimal) -> bool:
+        return bool(
+            self.hold_script(
+                keys=[WALLET_HOLD_KEY.format(user_id)],
+                args=[hold_id, str(amount), str(balance), time.time(), settings.WALLET_HOLD_TIMEOUT],
+            )
+        )
+
+    def release(self, user_id: str, hold_id: str) -> None:
+        try:
+            self.redis.hdel(WALLET_HOLD_KEY.format(user_id), hold_id)
+        except Exception as err:  # pylint: disable=W0718
+            logger.warning("[ReleaseWalletHoldFailed] %s %s %s", user_id, hold_id, err)
+
+    def load_held(self, user_id: str) -> Decimal:
+        try:
+            values = self.redis.hvals(WALLET_HOLD_KEY.format(user_id))
+        except Exception as err:  # pylint: disable=W0718
+            logger.warning("[LoadWalletHoldFailed] %s %s", user_id, err)
+            return Decimal(0)
+        now = time.time()
+        held = Decimal(0)
+        for value in values:
+            amount, expire_at = value.decode().split(":")
+            if float(expire_at) >= now:
+                held += Decimal(amount)
+        return held
+
+
+wallet_hold = WalletHold()
@@ -10,7 +10,6 @@ from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django.utils.translation import gettext
 from ovinc_client.core.auth import SessionAuthenticate
-from ovinc_client.core.paginations import NumPagination
 from ovinc_client.core.viewsets import MainViewSet
 from rest_framework import status
 from rest_framework.decorators import action
@@ -22,6 +21,7 @@ from apps.wallet.serializers import (
     NotifySerializer,
     PreChargeSerializer,
 )
+from core.paginations import KeysetPagination
 from utils.wxpay.api import NaivePrePay
 from utils.wxpay.constants import TradeStatus
 from utils.wxpay.utils import WXPaySignatureTool
@@ -136,7 +136,7 @@ class WalletViewSet(MainViewSet):
         queryset = BillingHistory.objects.filter(user=request.user).order_by("-created_at").prefetch_related("user")
 
         # page
-        paginator = NumPagination()
+        paginator = KeysetPagination(ordering=("-created_at", "-id"))
         page_queryset = paginator.paginate_queryset(queryset=queryset, request=request, view=self)
 
         serializer = BillingHistorySerializer(instance=page_queryset, many=True)
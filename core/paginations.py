@@ -0,0 +1,79 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.db.models import Q, QuerySet
+from django.utils.translation import gettext_lazy
+from ovinc_client.core.paginations import NumPagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+
+
+class KeysetPagination(NumPagination):
+    """
+    Keyset Pagination
+    seek by ordering fields with an opaque cursor instead of count and offset,
+    fall back to number pagination when no cursor param given
+    """
+
+    cursor_query_param = "cursor"
+    ordering = ("-created_at", "-id")
+    invalid_cursor_message = gettext_lazy("Invalid Cursor")
+
+    def __init__(self, ordering: tuple[str, ...] = None) -> None:
+        if ordering:
+            self.ordering = ordering
+        self.use_cursor = False
+        self.next_cursor = None
+
+    def paginate_queryset(self, queryset: QuerySet, request, view=None):
+        if self.cursor_query_param not in request.query_params:
+            return super().paginate_queryset(queryset=queryset, request=request, view=view)
+        self.use_cursor = True
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params[self.cursor_query_param]
+        if cursor:
+            queryset = queryset.filter(self.build_seek_filter(queryset, self.decode_cursor(queryset, cursor)))
+        results = list(queryset[: page_size + 1])
+        if len(results) > page_size:
+            results = results[:page_size]
+            self.next_cursor = self.encode_cursor(queryset, results[-1])
+        return results
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data=data)
+        return Response(OrderedDict([("next", self.next_cursor), ("results", data)]))
+
+    def get_fields(self, queryset: QuerySet) -> list:
+        return [queryset.model._meta.get_field(field.lstrip("-")) for field in self.ordering]
+
+    def encode_cursor(self, queryset: QuerySet, obj) -> str:
+        values = [field.value_to_string(obj) for field in self.get_fields(queryset)]
+        return base64.urlsafe_b64encode(json.dumps(values, separators=(",", ":")).encode()).decode()
+
+    def decode_cursor(self, queryset: QuerySet, cursor: str) -> list:
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            fields = self.get_fields(queryset)
+            if not isinstance(values, list) or len(values) != len(fields):
+                raise ValueError()
+            return [field.to_python(value) for field, value in zip(fields, values)]
+        except Exception as err:  # pylint: disable=W0718
+            raise NotFound(self.invalid_cursor_message) from err
+
+    def build_seek_filter(self, queryset: QuerySet, values: list) -> Q:
+        """
+        (a, b) after (x, y) => a > x or (a = x and b > y), direction by ordering
+        """
+
+        fields = self.get_fields(queryset)
+        seek_filter = Q()
+        for index, ordering in enumerate(self.ordering):
+            lookup = "lt" if ordering.startswith("-") else "gt"
+            condition = Q(**{f"{fields[index].name}__{lookup}": values[index]})
+            for prev_index in range(index):
+                condition &= Q(**{fields[prev_index].name: values[prev_index]})
+            seek_filter |= condition
+        return seek_filter
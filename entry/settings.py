@@ -137,6 +137,8 @@ CHANNEL_LAYERS = {
 CHANNEL_RETRY_TIMES = int(os.getenv("CHANNEL_RETRY_TIMES", "1"))
 CHANNEL_RETRY_SLEEP = int(os.getenv("CHANNEL_RETRY_SLEEP", "1"))  # seconds
 CHANNEL_CLOSE_KEY_TIMEOUT = int(os.getenv("CHANNEL_CLOSE_KEY_TIMEOUT", "3600"))
+CHAT_STREAM_COALESCE_DELAY = int(os.getenv("CHAT_STREAM_COALESCE_DELAY", "30"))  # ms, 0 to disable
+CHAT_STREAM_COALESCE_SIZE = int(os.getenv("CHAT_STREAM_COALESCE_SIZE", "4096"))  # bytes
 
 # Auth
 AUTH_PASSWORD_VALIDATORS = [
@@ -221,6 +223,73 @@ OVINC_API_RECORD_LOG = strtobool(os.getenv("OVINC_API_RECORD_LOG", "True"))
 # OpenAI
 OPENAI_CHAT_TIMEOUT = int(os.getenv("OPENAI_CHAT_TIMEOUT", "60"))
 OPENAI_PRE_CHECK_TIMEOUT = int(os.getenv("OPENAI_PRE_CHECK_TIMEOUT", "600"))
+OPENAI_CLIENT_IDLE_TIMEOUT = int(os.getenv("OPENAI_CLIENT_IDLE_TIMEOUT", "600"))
+OPENAI_CLIENT_MAX_CONNECTIONS = int(os.getenv("OPENAI_CLIENT_MAX_CONNECTIONS", "100"))
+OPENAI_CLIENT_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_CLIENT_MAX_KEEPALIVE_CONNECTIONS", "20"))
+OPENAI_CLIENT_KEEPALIVE_EXPIRY = int(os.getenv("OPENAI_CLIENT_KEEPALIVE_EXPIRY", "60"))
+
+# Upstream Router
+UPSTREAM_ROUTER_EWMA_ALPHA = float(os.getenv("UPSTREAM_ROUTER_EWMA_ALPHA", "0.2"))
+UPSTREAM_ROUTER_TTFT_BASE = int(os.getenv("UPSTREAM_ROUTER_TTFT_BASE", "1000"))  # ms
+UPSTREAM_ROUTER_MIN_SCORE = float(os.getenv("UPSTREAM_ROUTER_MIN_SCORE", "0.05"))
+UPSTREAM_ROUTER_CIRCUIT_FAILURES = int(os.getenv("UPSTREAM_ROUTER_CIRCUIT_FAILURES", "3"))
+UPSTREAM_ROUTER_CIRCUIT_OPEN_SECONDS = int(os.getenv("UPSTREAM_ROUTER_CIRCUIT_OPEN_SECONDS", "30"))
+UPSTREAM_ROUTER_HEALTH_TIMEOUT = int(os.getenv("UPSTREAM_ROUTER_HEALTH_TIMEOUT", str(60 * 60)))
+UPSTREAM_HEDGE_DEFAULT_DELAY = int(os.getenv("UPSTREAM_HEDGE_DEFAULT_DELAY", "3000"))  # ms
+UPSTREAM_HEDGE_PERCENTILE = int(os.getenv("UPSTREAM_HEDGE_PERCENTILE", "95"))
+UPSTREAM_HEDGE_SAMPLE_SIZE = int(os.getenv("UPSTREAM_HEDGE_SAMPLE_SIZE", "200"))
+UPSTREAM_HEDGE_MIN_SAMPLES = int(os.getenv("UPSTREAM_HEDGE_MIN_SAMPLES", "20"))
+UPSTREAM_ROUTER_FAILOVER_STATUS_CODES = [
+    int(code) for code in os.getenv("UPSTREAM_ROUTER_FAILOVER_STATUS_CODES", "408,429,500,502,503,504").split(",")
+]
+
+# Upstream Retry
+UPSTREAM_RETRY_STATUS_CODES = [
+    int(code) for code in os.getenv("UPSTREAM_RETRY_STATUS_CODES", "408,429,500,502,503,504").split(",")
+]
+UPSTREAM_RETRY_MAX_ATTEMPTS = int(os.getenv("UPSTREAM_RETRY_MAX_ATTEMPTS", "3"))
+UPSTREAM_RETRY_BACKOFF = int(os.getenv("UPSTREAM_RETRY_BACKOFF", "500"))  # ms
+UPSTREAM_RETRY_MAX_BACKOFF = int(os.getenv("UPSTREAM_RETRY_MAX_BACKOFF", "8000"))  # ms
+UPSTREAM_RETRY_DEADLINE = int(os.getenv("UPSTREAM_RETRY_DEADLINE", "30"))  # s
+
+# Model Registry
+AI_MODEL_REGISTRY_CHECK_INTERVAL = float(os.getenv("AI_MODEL_REGISTRY_CHECK_INTERVAL", "1"))
+USER_MODEL_GRANTS_TIMEOUT = int(os.getenv("USER_MODEL_GRANTS_TIMEOUT", str(60 * 60 * 24)))
+USER_MODEL_GRANTS_LOCAL_SIZE = int(os.getenv("USER_MODEL_GRANTS_LOCAL_SIZE", "10000"))
+
+# Context Budget
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "heuristic")
+CONTEXT_TIKTOKEN_ENCODING = os.getenv("CONTEXT_TIKTOKEN_ENCODING", "o200k_base")
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "0"))
+CONTEXT_RESERVED_COMPLETION_TOKENS = int(os.getenv("CONTEXT_RESERVED_COMPLETION_TOKENS", "4096"))
+CONTEXT_IMAGE_TOKENS = int(os.getenv("CONTEXT_IMAGE_TOKENS", "1000"))
+
+# Billing
+BILLING_DRAIN_INTERVAL = float(os.getenv("BILLING_DRAIN_INTERVAL", "5"))
+BILLING_BATCH_SIZE = int(os.getenv("BILLING_BATCH_SIZE", "500"))
+BILLING_MAX_BATCHES = int(os.getenv("BILLING_MAX_BATCHES", "20"))
+BILLING_CLAIM_IDLE_TIME = int(os.getenv("BILLING_CLAIM_IDLE_TIME", "60"))
+BILLING_ORPHAN_TIMEOUT = int(os.getenv("BILLING_ORPHAN_TIMEOUT", str(60 * 60)))
+
+# Wallet Hold
+WALLET_HOLD_TIMEOUT = int(os.getenv("WALLET_HOLD_TIMEOUT", str(60 * 60)))
+
+# Response Cache
+RESPONSE_CACHE_TIMEOUT = int(os.getenv("RESPONSE_CACHE_TIMEOUT", str(60 * 60 * 24)))
+RESPONSE_CACHE_MAX_SIZE = int(os.getenv("RESPONSE_CACHE_MAX_SIZE", str(64 * 1024)))
+RESPONSE_CACHE_PRICE_RATE = float(os.getenv("RESPONSE_CACHE_PRICE_RATE", "0"))
+RESPONSE_CACHE_REPLAY_CHUNK_SIZE = int(os.getenv("RESPONSE_CACHE_REPLAY_CHUNK_SIZE", "16"))
+RESPONSE_CACHE_REPLAY_DELAY = int(os.getenv("RESPONSE_CACHE_REPLAY_DELAY", "10"))  # ms
+
+# Upstream Limiter
+UPSTREAM_LIMITER_QUEUE_SIZE = int(os.getenv("UPSTREAM_LIMITER_QUEUE_SIZE", "100"))
+UPSTREAM_LIMITER_QUEUE_TIMEOUT = int(os.getenv("UPSTREAM_LIMITER_QUEUE_TIMEOUT", "60"))
+UPSTREAM_LIMITER_POLL_INTERVAL = float(os.getenv("UPSTREAM_LIMITER_POLL_INTERVAL", "0.5"))
+UPSTREAM_LIMITER_HEARTBEAT_TIMEOUT = int(os.getenv("UPSTREAM_LIMITER_HEARTBEAT_TIMEOUT", "10"))
+UPSTREAM_LIMITER_FAIR_INTERVAL = float(os.getenv("UPSTREAM_LIMITER_FAIR_INTERVAL", "1"))
+UPSTREAM_LIMITER_LEASE = int(os.getenv("UPSTREAM_LIMITER_LEASE", "600"))
+# holders renew lease at this interval while streaming, should be well below lease
+UPSTREAM_LIMITER_RENEW_INTERVAL = int(os.getenv("UPSTREAM_LIMITER_RENEW_INTERVAL", "60"))
 
 # QCLOUD
 QCLOUD_SECRET_ID = os.getenv("QCLOUD_SECRET_ID")
@@ -268,6 +337,18 @@ CHATLOG_QUERY_DAYS = int(os.getenv("CHATLOG_QUERY_DAYS", "7"))
 # IMAGE
 ENABLE_IMAGE_PROXY = strtobool(os.getenv("ENABLE_IMAGE_PROXY", "False"))
 LOAD_IMAGE_TIMEOUT = int(os.getenv("LOAD_IMAGE_TIMEOUT", "60"))
+LOAD_IMAGE_TOTAL_TIMEOUT = int(os.getenv("LOAD_IMAGE_TOTAL_TIMEOUT", "90"))
+LOAD_IMAGE_CONCURRENCY = int(os.getenv("LOAD_IMAGE_CONCURRENCY", "8"))
+LOAD_IMAGE_MAX_CONNECTIONS = int(os.getenv("LOAD_IMAGE_MAX_CONNECTIONS", "50"))
+LOAD_IMAGE_MAX_SIZE = int(os.getenv("LOAD_IMAGE_MAX_SIZE", str(20 * 1024 * 1024)))
+VISION_IMAGE_MAX_EDGE = int(os.getenv("VISION_IMAGE_MAX_EDGE", "2048"))  # 0 to disable resizing
+VISION_IMAGE_QUALITY = int(os.getenv("VISION_IMAGE_QUALITY", "85"))
+VISION_IMAGE_FORMAT = os.getenv("VISION_IMAGE_FORMAT", "WEBP")
+VISION_IMAGE_RECOMPRESS_SIZE = int(os.getenv("VISION_IMAGE_RECOMPRESS_SIZE", str(1024 * 1024)))
+VISION_IMAGE_PROCESS_WORKERS = int(os.getenv("VISION_IMAGE_PROCESS_WORKERS", "4"))
+IMAGE_CACHE_TIMEOUT = int(os.getenv("IMAGE_CACHE_TIMEOUT", str(60 * 60)))
+IMAGE_CACHE_MAX_ITEM_SIZE = int(os.getenv("IMAGE_CACHE_MAX_ITEM_SIZE", str(8 * 1024 * 1024)))
+IMAGE_CACHE_LOCAL_MAX_SIZE = int(os.getenv("IMAGE_CACHE_LOCAL_MAX_SIZE", str(128 * 1024 * 1024)))
 
 # File
 ENABLE_FILE_UPLOAD = strtobool(os.getenv("ENABLE_FILE_UPLOAD", "False"))
@@ -300,6 +381,22 @@ OPENROUTER_API_TIMEOUT = int(os.getenv("OPENROUTER_API_TIMEOUT", "60"))
 
 # Message Log
 MESSAGE_LOG_RETAIN_DAYS = int(os.getenv("MESSAGE_LOG_RETAIN_DAYS", "7"))
+MESSAGE_LOG_BATCH_SIZE = int(os.getenv("MESSAGE_LOG_BATCH_SIZE", "500"))
+MESSAGE_LOG_BATCH_CONTENT_SIZE = int(os.getenv("MESSAGE_LOG_BATCH_CONTENT_SIZE", str(4 * 1024 * 1024)))
+MESSAGE_SYNC_PAGE_SIZE = int(os.getenv("MESSAGE_SYNC_PAGE_SIZE", "100"))
+MESSAGE_SYNC_MAX_PAGE_SIZE = int(os.getenv("MESSAGE_SYNC_MAX_PAGE_SIZE", "1000"))
+# changes younger than this may still have uncommitted lower ids, cursor stops before them
+MESSAGE_SYNC_SETTLE_SECONDS = float(os.getenv("MESSAGE_SYNC_SETTLE_SECONDS", "2"))
+
+# Retention
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "1000"))
+RETENTION_BATCH_INTERVAL = float(os.getenv("RETENTION_BATCH_INTERVAL", "0.5"))
+RETENTION_MAX_ROWS_PER_SECOND = int(os.getenv("RETENTION_MAX_ROWS_PER_SECOND", "0"))
+# purge not continued within this after scheduled is considered lost and restarted by next schedule
+RETENTION_RUNNING_TIMEOUT = int(os.getenv("RETENTION_RUNNING_TIMEOUT", "60"))
+RETENTION_CHECKPOINT_TIMEOUT = int(os.getenv("RETENTION_CHECKPOINT_TIMEOUT", str(60 * 60 * 24 * 7)))
+# charged chat logs older than this are purged, 0 to keep forever
+CHATLOG_RETAIN_DAYS = int(os.getenv("CHATLOG_RETAIN_DAYS", "0"))
 
 # Metric
 ENABLE_METRIC = strtobool(os.getenv("ENABLE_METRIC", "False"))
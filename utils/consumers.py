@@ -1,4 +1,5 @@
-from channels.generic.websocket import WebsocketConsumer as _WebsocketConsumer
+from asgiref.sync import sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer as _AsyncWebsocketConsumer
 from django.conf import settings
 from django.core.cache import cache
 
@@ -6,12 +7,18 @@ from apps.chat.constants import WS_CLOSED_KEY
 from utils.connections import connections_handler
 
 
-class WebsocketConsumer(_WebsocketConsumer):
-    def connect(self):
-        super().connect()
-        connections_handler.add_connection(self.channel_name, self.scope["client"][0])
+class AsyncWebsocketConsumer(_AsyncWebsocketConsumer):
+    async def connect(self):
+        await super().connect()
+        await sync_to_async(connections_handler.add_connection, thread_sensitive=False)(
+            self.channel_name, self.scope["client"][0]
+        )
 
-    def disconnect(self, code):
-        cache.set(key=WS_CLOSED_KEY.format(self.channel_name), value=True, timeout=settings.CHANNEL_CLOSE_KEY_TIMEOUT)
-        super().disconnect(code)
-        connections_handler.remove_connection(self.channel_name, self.scope["client"][0])
+    async def disconnect(self, code):
+        await cache.aset(
+            key=WS_CLOSED_KEY.format(self.channel_name), value=True, timeout=settings.CHANNEL_CLOSE_KEY_TIMEOUT
+        )
+        await super().disconnect(code)
+        await sync_to_async(connections_handler.remove_connection, thread_sensitive=False)(
+            self.channel_name, self.scope["client"][0]
+        )
@@ -4,6 +4,13 @@ class PrometheusMetrics:
     WEBSOCKET_CONN = "websocket_conn"
     PROMPT_TOKEN = "prompt_token"
     COMPLETION_TOKEN = "completion_token"
+    UPSTREAM_FAILOVER = "upstream_failover"
+    UPSTREAM_RETRY = "upstream_retry"
+    UPSTREAM_HEDGE = "upstream_hedge"
+    UPSTREAM_HEDGE_WIN = "upstream_hedge_win"
+    UPSTREAM_QUEUE_DEPTH = "upstream_queue_depth"
+    UPSTREAM_QUEUE_WAIT = "upstream_queue_wait"
+    RESPONSE_CACHE_HIT = "response_cache_hit"
 
 
 class PrometheusLabels: